@@ -1,10 +1,5 @@
 
 import time
-from scipy import integrate, signal
-from mne.time_frequency import psd_array_multitaper
-from brainflow import DataFilter, FilterTypes
-import numpy as np
-import pandas as pd
 import pyqtgraph as pg
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import (
@@ -21,14 +16,11 @@ from PySide6.QtWidgets import (
     QRadioButton,
     QGroupBox
 )
+from bandpowerPipeline import BandpowerPipeline
+from recordingStore import RECORDING_EXTENSION, save_recording
+from spectralEngine import PSD_METHODS
+from stateRecorder import StateRecorder
 NUM_ELECTRODES = 8
-EEG_BANDS = [
-    [0, 4],  # Delta
-    [4, 7],  # Theta
-    [7, 12],  # Alpha
-    [12, 30],  # Beta
-    [30, 50]  # Gamma
-]
 
 # Enables user to capture and compare the bandpower of two recording sessions
 class ABBandpowerWidget(QWidget):
@@ -45,6 +37,8 @@ class ABBandpowerWidget(QWidget):
         self.b_record_time = 0
         self.a_data = None
         self.b_data = None
+        self.a_recorder = None
+        self.b_recorder = None
 
         # Data processing variables
         self.filter_sixty_hz = False
@@ -53,7 +47,7 @@ class ABBandpowerWidget(QWidget):
         self.custom_low_frequency = 0
         self.custom_high_frequency = 125
 
-        self.bp_methods = ["Welch's", "Multitaper", "FFT"]
+        self.bp_methods = PSD_METHODS
         self.selected_bp_method = self.bp_methods[0]
         self.welch_window_length_fraction_of_total = 0.1
 
@@ -63,6 +57,7 @@ class ABBandpowerWidget(QWidget):
         self.relative_plot = False
 
         # Processed data variables
+        self.pipeline = BandpowerPipeline()
         self.a_processed_bp = None
         self.b_processed_bp = None
         self.a_frequencies = [0, 0]
@@ -84,14 +79,13 @@ class ABBandpowerWidget(QWidget):
 
         a_record_time_input = QLineEdit()
         a_record_time_input.setPlaceholderText("0")
-        a_record_time_input.setMaxLength(2)
+        a_record_time_input.setMaxLength(3)
         a_record_time_input.textChanged.connect(self.set_a_record_time)
         a_record_time_input.setStyleSheet("""background-color: #fff; color: #000;font: 15px; min-width: 30px;
                                              margin-bottom: 0px;  padding: 5px; max-width: 30px;""")
 
         self.a_record_button = QPushButton("Record State A")
-        self.a_record_button.pressed.connect(self.pressed_record_a)
-        self.a_record_button.released.connect(self.record_a)
+        self.a_record_button.pressed.connect(self.record_a)
         self.a_record_button.setStyleSheet("""
             border-image: none !important;
             border-style: outset;
@@ -114,14 +108,13 @@ class ABBandpowerWidget(QWidget):
 
         b_record_time_input = QLineEdit()
         b_record_time_input.setPlaceholderText("0")
-        b_record_time_input.setMaxLength(2)
+        b_record_time_input.setMaxLength(3)
         b_record_time_input.textChanged.connect(self.set_b_record_time)
         b_record_time_input.setStyleSheet("""background-color: #fff; color: #000;font: 15px; min-width: 30px;
                                              margin-bottom: 0px; max-width: 30px; padding: 5px;""")
 
         self.b_record_button = QPushButton("Record State B")
-        self.b_record_button.pressed.connect(self.record_b_pressed)
-        self.b_record_button.released.connect(self.record_b)
+        self.b_record_button.pressed.connect(self.record_b)
         self.b_record_button.setStyleSheet("""
             border-image: none !important;
             border-style: outset;
@@ -464,31 +457,59 @@ class ABBandpowerWidget(QWidget):
 
         self.setLayout(layout)
 
-    def pressed_record_a(self):
-        self.a_record_button.setText("Recording...")
-
+    # Start recording state A, or cancel the recording in progress
     def record_a(self):
-        num_data_points = self.parent.sampling_rate * self.a_record_time
+        if self.a_recorder is not None and self.a_recorder.recording:
+            self.a_recorder.cancel()
+            return
         print('recording state a')
-        time.sleep(self.a_record_time)  # let buffer get filled
+        self.a_recorder = StateRecorder(self.parent.acquisition, self.parent.exg_channels[:NUM_ELECTRODES])
+        self.a_recorder.progress.connect(self.show_a_progress)
+        self.a_recorder.finished.connect(self.finish_record_a)
+        self.a_recorder.cancelled.connect(self.cancelled_record_a)
+        self.a_record_button.setText("Recording... (press to cancel)")
+        self.a_recorder.start(self.a_record_time)
+
+    def show_a_progress(self, percent):
+        self.a_record_button.setText("Recording... " + str(percent) + "% (press to cancel)")
+
+    def cancelled_record_a(self):
+        self.a_record_button.setText("Record State A")
+
+    def finish_record_a(self, data):
         self.a_record_button.setText("Record State A")
-        self.a_data = self.parent.board_shim.get_current_board_data(num_samples=num_data_points)[1:9]
+        self.a_data = data
         if self.a_data is not None and self.b_data is not None:
             self.process_bp()
-        pd.DataFrame(np.transpose(self.a_data)).to_csv('state_raw_data/a_data.csv')
-
-    def record_b_pressed(self):
-        self.b_record_button.setText("Recording...")
+        save_recording('state_raw_data/a_data' + RECORDING_EXTENSION, self.a_data, self.parent.sampling_rate,
+                       self.parent.board_id, self.a_recorder.rows, self.a_recorder.start_time, time.time())
 
+    # Start recording state B, or cancel the recording in progress
     def record_b(self):
-        num_data_points = self.parent.sampling_rate * self.b_record_time
+        if self.b_recorder is not None and self.b_recorder.recording:
+            self.b_recorder.cancel()
+            return
         print('recording state b')
-        time.sleep(self.b_record_time)  # let buffer get filled
+        self.b_recorder = StateRecorder(self.parent.acquisition, self.parent.exg_channels[:NUM_ELECTRODES])
+        self.b_recorder.progress.connect(self.show_b_progress)
+        self.b_recorder.finished.connect(self.finish_record_b)
+        self.b_recorder.cancelled.connect(self.cancelled_record_b)
+        self.b_record_button.setText("Recording... (press to cancel)")
+        self.b_recorder.start(self.b_record_time)
+
+    def show_b_progress(self, percent):
+        self.b_record_button.setText("Recording... " + str(percent) + "% (press to cancel)")
+
+    def cancelled_record_b(self):
         self.b_record_button.setText("Record State B")
-        self.b_data = self.parent.board_shim.get_current_board_data(num_samples=num_data_points)[1:9]
+
+    def finish_record_b(self, data):
+        self.b_record_button.setText("Record State B")
+        self.b_data = data
         if self.a_data is not None and self.b_data is not None:
             self.process_bp()
-        pd.DataFrame(np.transpose(self.b_data)).to_csv('state_raw_data/b_data.csv')
+        save_recording('state_raw_data/b_data' + RECORDING_EXTENSION, self.b_data, self.parent.sampling_rate,
+                       self.parent.board_id, self.b_recorder.rows, self.b_recorder.start_time, time.time())
 
     def set_a_record_time(self, seconds):
         self.a_record_time = int(seconds)
@@ -578,152 +599,42 @@ class ABBandpowerWidget(QWidget):
         self.graph.p.autoRange()
 
     # Processes the bandpower for states a and b given the current settings
+    # Only the stages after the setting that changed are recomputed
     def process_bp(self):
+        if self.a_data is None or self.b_data is None:
+            return
+        if self.selected_bp_method not in PSD_METHODS:
+            print('ERROR: Bandpower method is not implemented')
+            return
+        selected = [i for i in range(0, NUM_ELECTRODES)
+                    if self.include_all_electrodes or (i+1) in self.custom_electrode_selection]
+        if len(selected) == 0:
+            return
+        if self.include_all_frequencies:
+            frequency_range = None
+        else:
+            frequency_range = (self.custom_low_frequency, self.custom_high_frequency)
+
+        self.pipeline.set_data(self.a_data, self.b_data)
+        with self.parent.profiler.stage('ab_bandpower.pipeline'):
+            (a_plot, b_plot), (a_band_values, b_band_values) = \
+                self.pipeline.run(self.parent.sampling_rate, self.selected_bp_method,
+                                  self.welch_window_length_fraction_of_total, self.filter_sixty_hz,
+                                  self.filter_zero_to_five_hz, selected, frequency_range, self.relative_plot)
+
+        self.a_frequencies, self.a_processed_bp = a_plot
+        self.b_frequencies, self.b_processed_bp = b_plot
+        self.a_standard_band_values = a_band_values
+        self.b_standard_band_values = b_band_values
+
+        with self.parent.profiler.stage('ab_bandpower.plot'):
+            self.graph.clear_plots()
+
+            # Plot A
+            self.graph.plot_a(self.a_frequencies, self.a_processed_bp)
 
-        a_processed_channel_holder = []
-        b_processed_channel_holder = []
-        a_frequencies = []
-        b_frequencies = []
-        uncut_a_frequencies = []
-        uncut_b_frequencies = []
-        uncut_a_bandpowers = []
-        uncut_b_bandpowers = []
-
-        for i in range(0, NUM_ELECTRODES):
-            if self.include_all_electrodes or (i+1) in self.custom_electrode_selection:
-                a_channel = self.a_data[i] - np.mean(self.a_data[i])
-                b_channel = self.b_data[i] - np.mean(self.b_data[i])
-
-                if self.filter_sixty_hz:
-                    DataFilter.perform_bandstop(a_channel, self.parent.sampling_rate, 60, 4,
-                                                2, FilterTypes.BUTTERWORTH.value, 0.0)
-                    DataFilter.perform_bandstop(b_channel, self.parent.sampling_rate, 60, 4,
-                                                2, FilterTypes.BUTTERWORTH.value, 0.0)
-
-                if self.filter_zero_to_five_hz:
-                    band_pass_min = 5
-                    band_pass_max = 125
-                    center_freq = (band_pass_min + band_pass_max) / 2.0
-                    band_width = band_pass_max - band_pass_min
-                    DataFilter.perform_bandpass(a_channel, self.parent.sampling_rate, center_freq, band_width, 2,
-                                                FilterTypes.BUTTERWORTH.value, 0.0)
-                    DataFilter.perform_bandpass(b_channel, self.parent.sampling_rate, center_freq, band_width, 2,
-                                                FilterTypes.BUTTERWORTH.value, 0.0)
-
-                if self.selected_bp_method == "Welch's":
-                    a_welch_window_length = int(self.welch_window_length_fraction_of_total * len(a_channel))
-                    b_welch_window_length = int(self.welch_window_length_fraction_of_total * len(b_channel))
-                    a_frequencies, a_power_spectral_density = \
-                        signal.welch(a_channel, fs=self.parent.sampling_rate, nperseg=a_welch_window_length)
-                    b_frequencies, b_power_spectral_density = \
-                        signal.welch(b_channel, fs=self.parent.sampling_rate, nperseg=b_welch_window_length)
-                elif self.selected_bp_method == "Multitaper":
-                    a_power_spectral_density, a_frequencies = \
-                        psd_array_multitaper(a_channel, self.parent.sampling_rate,
-                                             adaptive=True, normalization='full', verbose=0)
-                    b_power_spectral_density, b_frequencies = \
-                        psd_array_multitaper(b_channel, self.parent.sampling_rate,
-                                             adaptive=True, normalization='full', verbose=0)
-                elif self.selected_bp_method == "FFT":
-                    a_fft = np.fft.rfft(a_channel)
-                    a_power_spectral_density = np.multiply(a_fft, np.conjugate(a_fft)).real
-                    a_frequencies = np.fft.rfftfreq(len(a_channel), 1/self.parent.sampling_rate)
-                    b_fft = np.fft.rfft(b_channel)
-                    b_power_spectral_density = np.multiply(b_fft, np.conjugate(b_fft)).real
-                    b_frequencies = np.fft.rfftfreq(len(b_channel), 1/self.parent.sampling_rate)
-                else:
-                    print('ERROR: Bandpower method is not implemented')
-                    return
-
-                uncut_a_frequencies = a_frequencies.copy()
-                uncut_b_frequencies = b_frequencies.copy()
-                uncut_a_bandpowers = a_power_spectral_density.copy()
-                uncut_b_bandpowers = b_power_spectral_density.copy()
-
-                if self.include_all_frequencies:
-                    self.a_total_power = integrate.simps(a_power_spectral_density)
-                    self.b_total_power = integrate.simps(b_power_spectral_density)
-                else:
-                    a_band_idx = np.logical_and(a_frequencies >= self.custom_low_frequency,
-                                                a_frequencies <= self.custom_high_frequency)
-                    a_frequencies = a_frequencies[a_band_idx]
-                    a_power_spectral_density = a_power_spectral_density[a_band_idx]
-                    self.a_total_power = integrate.simps(a_power_spectral_density)
-
-                    b_band_idx = np.logical_and(b_frequencies >= self.custom_low_frequency,
-                                                b_frequencies <= self.custom_high_frequency)
-                    b_frequencies = b_frequencies[b_band_idx]
-                    b_power_spectral_density = b_power_spectral_density[b_band_idx]
-                    self.b_total_power = integrate.simps(b_power_spectral_density)
-
-                # Get relevant band powers
-                a_band_powers = []
-                for j in range(len(a_frequencies)):
-                    bin = a_frequencies[j]
-                    band_power = a_power_spectral_density[j]
-                    if self.relative_plot:
-                        band_power = band_power / self.a_total_power
-                    a_band_powers.append(band_power)
-
-                b_band_powers = []
-                for j in range(len(b_frequencies)):
-                    bin = b_frequencies[j]
-                    band_power = b_power_spectral_density[j]
-                    if self.relative_plot:
-                        band_power = band_power / self.b_total_power
-                    b_band_powers.append(band_power)
-
-                a_processed_channel_holder.append(a_band_powers)
-                b_processed_channel_holder.append(b_band_powers)
-
-        self.a_frequencies = np.array(a_frequencies)
-        self.b_frequencies = np.array(b_frequencies)
-        self.a_processed_bp = np.mean(a_processed_channel_holder, axis=0)
-        self.b_processed_bp = np.mean(b_processed_channel_holder, axis=0)
-
-        self.graph.clear_plots()
-
-        # Plot A
-        self.graph.plot_a(self.a_frequencies, self.a_processed_bp)
-
-        # Plot B
-        self.graph.plot_b(self.b_frequencies, self.b_processed_bp)
-
-        # Get Band Powers #
-
-        for i in range(len(uncut_a_frequencies)):
-            if uncut_a_frequencies[i] not in a_frequencies:
-                uncut_a_frequencies[i] = 0
-                uncut_a_bandpowers[i] = 0
-
-        for i in range(len(uncut_b_frequencies)):
-            if uncut_b_frequencies[i] not in b_frequencies:
-                uncut_b_frequencies[i] = 0
-                uncut_b_bandpowers[i] = 0
-
-        for i in range(len(EEG_BANDS)):
-            start_freq = EEG_BANDS[i][0]
-            end_freq = EEG_BANDS[i][1]
-
-            # Process bands for a
-            uncut_a_band_idx = np.logical_and(uncut_a_frequencies >= start_freq,
-                                              uncut_a_frequencies <= end_freq)
-            a_band_psd = uncut_a_bandpowers[uncut_a_band_idx]
-            if len(a_band_psd) > 1:
-                a_band_power = integrate.simps(a_band_psd)
-            else:
-                a_band_power = 0
-            self.a_standard_band_values[i] = a_band_power / self.a_total_power
-
-            # Process bands for b
-            uncut_b_band_idx = np.logical_and(uncut_b_frequencies >= start_freq,
-                                              uncut_b_frequencies <= end_freq)
-            b_band_psd = uncut_b_bandpowers[uncut_b_band_idx]
-            if len(b_band_psd) > 1:
-                b_band_power = integrate.simps(b_band_psd)
-            else:
-                b_band_power = 0
-            self.b_standard_band_values[i] = b_band_power / self.b_total_power
+            # Plot B
+            self.graph.plot_b(self.b_frequencies, self.b_processed_bp)
 
         self.update_output_information()
 
@@ -0,0 +1,144 @@
+import time
+import logging
+import threading
+from PySide6.QtCore import QObject, QThread, Signal
+from brainflow.board_shim import BoardShim
+from ringBuffer import RingBuffer
+
+# Number of seconds of samples kept in the shared acquisition buffer
+BUFFER_SECONDS = 180
+# How often the acquisition thread drains the board
+POLL_INTERVAL_MS = 10
+# Size of BrainFlow's internal buffer
+STREAM_BUFFER_SIZE = 45000
+# A consumer that hasn't read for this long (e.g. a page that isn't shown) doesn't hold back
+# a paced replay
+CONSUMER_TIMEOUT_S = 1.0
+
+
+# Single owner of the board stream
+# Drains get_board_data() into a shared ring buffer so every page reads from the
+# same samples instead of copying its own window out of BrainFlow each tick.
+# All board I/O runs on an AcquisitionWorker thread, never on the GUI thread
+class AcquisitionService(QObject):
+    connected = Signal(bool)
+    samplesReady = Signal(int)
+    # A replay that doesn't loop has sent its last sample
+    replayFinished = Signal()
+
+    def __init__(self, board_shim, buffer_seconds=BUFFER_SECONDS, profiler=None):
+        super().__init__()
+        self.board_shim = board_shim
+        self.profiler = profiler
+        self.board_id = board_shim.get_board_id()
+        self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+        self.num_rows = BoardShim.get_num_rows(self.board_id)
+        self.buffer = RingBuffer(self.num_rows, buffer_seconds * self.sampling_rate)
+        self.lock = threading.Lock()
+        self.worker = None
+        # consumer -> (samples read up to, time of the last read)
+        self.consumers = {}
+
+    # Prepare the session and start streaming on a background thread
+    # connected is emitted once the board is ready (or failed)
+    # paced only polls again once every active consumer has read all samples, so a max speed
+    # replay runs as fast as the pages can process it without overwriting unread samples
+    def start(self, streamer_params='', poll_interval_ms=POLL_INTERVAL_MS, paced=False):
+        self.worker = AcquisitionWorker(self, streamer_params, poll_interval_ms, paced)
+        self.worker.start()
+
+    def stop(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
+    # Move any new samples from BrainFlow into the ring buffer
+    # Called from the acquisition thread
+    def poll(self):
+        start = time.perf_counter()
+        data = self.board_shim.get_board_data()
+        with self.lock:
+            self.buffer.write(data)
+        if self.profiler is not None:
+            self.profiler.record('acquisition.poll', start, time.perf_counter())
+        return data.shape[1]
+
+    # Samples that arrived after `cursor` (a running sample count) and the new cursor
+    # Lets a consumer process each sample exactly once, e.g. through a streaming filter.
+    # Passing consumer registers how far it has read, for paced replays
+    def get_data_since(self, cursor, consumer=None):
+        with self.lock:
+            if consumer is not None:
+                self.consumers[consumer] = (self.buffer.total_written, time.monotonic())
+            return self.buffer.since(cursor), self.buffer.total_written
+
+    # Cursor that makes the next get_data_since return the newest num_samples samples
+    def cursor(self, num_samples=0, consumer=None):
+        with self.lock:
+            cursor = max(0, self.buffer.total_written - int(num_samples))
+            if consumer is not None:
+                self.consumers[consumer] = (cursor, time.monotonic())
+            return cursor
+
+    # Stop waiting for a consumer that no longer reads
+    def release(self, consumer):
+        with self.lock:
+            self.consumers.pop(consumer, None)
+
+    # True while a consumer that read in the last CONSUMER_TIMEOUT_S hasn't read everything
+    def consumers_behind(self):
+        now = time.monotonic()
+        with self.lock:
+            total = self.buffer.total_written
+            return any(position < total and now - read_time < CONSUMER_TIMEOUT_S
+                       for position, read_time in self.consumers.values())
+
+
+# Background thread that owns all blocking BrainFlow calls for a session
+class AcquisitionWorker(QThread):
+    def __init__(self, acquisition, streamer_params='', poll_interval_ms=POLL_INTERVAL_MS, paced=False):
+        super().__init__()
+        self.acquisition = acquisition
+        self.board_shim = acquisition.board_shim
+        self.streamer_params = streamer_params
+        self.poll_interval_ms = poll_interval_ms
+        self.paced = paced
+        self.running = True
+
+    def run(self):
+        try:
+            self.board_shim.prepare_session()
+            self.board_shim.start_stream(STREAM_BUFFER_SIZE, self.streamer_params)
+        except BaseException:
+            logging.warning('Exception', exc_info=True)
+            self.acquisition.connected.emit(False)
+            return
+        self.acquisition.connected.emit(self.board_shim.is_prepared())
+
+        # Only replays can finish
+        is_finished = getattr(self.board_shim, 'is_finished', None)
+        while self.running:
+            if self.paced and self.acquisition.consumers_behind():
+                self.msleep(1)
+                continue
+            try:
+                num_samples = self.acquisition.poll()
+            except BaseException:
+                logging.warning('Exception', exc_info=True)
+                break
+            if num_samples > 0:
+                self.acquisition.samplesReady.emit(num_samples)
+            if is_finished is not None and is_finished():
+                self.acquisition.replayFinished.emit()
+                break
+            self.msleep(self.poll_interval_ms)
+
+        try:
+            self.board_shim.stop_stream()
+            self.board_shim.release_session()
+        except BaseException:
+            logging.warning('Exception', exc_info=True)
+
+    def stop(self):
+        self.running = False
+        self.wait()
@@ -1,10 +1,11 @@
 import sys
 import argparse
 import logging
-from PySide6.QtCore import Qt
-from pyqtgraph.Qt import QtCore
+import numpy as np
+from PySide6.QtCore import Qt, Signal
 from PySide6.QtWidgets import (
     QApplication,
+    QFileDialog,
     QHBoxLayout,
     QLabel,
     QMainWindow,
@@ -18,7 +19,12 @@ from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
 from brainflow.data_filter import DataFilter
 from brainflow.ml_model import MLModel
 
+from acquisitionService import *
 from helpWindow import *
+from pageScheduler import *
+from qualityMonitor import *
+from replaySource import *
+from stageProfiler import *
 from welcomeWidget import *
 from bCIIntroWidget import *
 from eegIntroWidget import *
@@ -34,10 +40,15 @@ from ABBandpowerWidget import *
 
 # Main application window
 class MainWindow(QMainWindow):
+    headsetConnected = Signal(bool)
+
     def __init__(self, app):
         self.app = app
-        self.timer = QtCore.QTimer()
+        self.acquisition = None
+        self.qualityMonitor = None
         self.helpWindow = None
+        self.profiler = StageProfiler()
+        self.scheduler = PageScheduler(self.profiler)
         super().__init__()
         # Main Window Set Up
         self.setWindowTitle("Brain Boi 2000")
@@ -51,6 +62,8 @@ class MainWindow(QMainWindow):
         self.button_layout = QHBoxLayout()
         self.stacklayout = QStackedLayout()
         pageLayout.addLayout(self.headset_status_layout)
+        self.profilerOverlay = ProfilerOverlay(self.profiler)
+        pageLayout.addWidget(self.profilerOverlay)
         pageLayout.addLayout(self.stacklayout)
         pageLayout.addLayout(self.button_layout)
 
@@ -62,6 +75,8 @@ class MainWindow(QMainWindow):
         """)
         self.statusLabel = QLabel("Disconnected")
         self.statusLabel.setStyleSheet("color: red;")
+        self.signalLabel = QLabel("")
+        self.signalLabel.setStyleSheet("color: #fff;")
         self.connectHeadset = QPushButton("Connect Headset")
         self.connectHeadset.pressed.connect(self.connect_headset)
 
@@ -102,6 +117,14 @@ class MainWindow(QMainWindow):
         self.helpButton.pressed.connect(self.show_help_window)
         toolbar.addWidget(self.helpButton)
 
+        # Profiler overlay and trace export - on toolbar
+        self.profilerButton = QPushButton("Profiler")
+        self.profilerButton.pressed.connect(self.profilerOverlay.toggle)
+        toolbar.addWidget(self.profilerButton)
+        self.traceButton = QPushButton("Export Trace")
+        self.traceButton.pressed.connect(self.export_trace)
+        toolbar.addWidget(self.traceButton)
+
         # Add Pages to stack
         self.stacklayout.addWidget(WelcomeWidget(self))
         self.stacklayout.addWidget(BCIIntroWidget(self))
@@ -121,6 +144,7 @@ class MainWindow(QMainWindow):
         widget.setLayout(pageLayout)
         widget.setStyleSheet("background-color: #0F0F0F;")
         self.setCentralWidget(widget)        
+        self.scheduler.activate(self.stacklayout.currentWidget())
 
 
     # Connect to BCI headset
@@ -150,6 +174,11 @@ class MainWindow(QMainWindow):
         parser.add_argument('--board-id', type=int, help='board id, check docs to get a list of supported boards',
                             required=False, default=BoardIds.SYNTHETIC_BOARD)
         parser.add_argument('--file', type=str, help='file', required=False, default='')
+        parser.add_argument('--replay-file', type=str, help='stream a saved recording (.brec or .csv) instead of a board',
+                            required=False, default='')
+        parser.add_argument('--replay-speed', type=float, help='replay pace as a multiple of real time, 0 for max speed',
+                            required=False, default=1.0)
+        parser.add_argument('--replay-once', action='store_true', help='stop at the end of the replay instead of looping')
         args = parser.parse_args()
 
         params = BrainFlowInputParams()
@@ -166,35 +195,71 @@ class MainWindow(QMainWindow):
 
         try:
             #self.board_shim = BoardShim(args.board_id, params)
-            self.board_shim = BoardShim(BoardIds.CYTON_BOARD, params)
+            if args.replay_file:
+                self.board_shim = ReplayBoard(args.replay_file, args.replay_speed, not args.replay_once)
+            else:
+                self.board_shim = BoardShim(BoardIds.CYTON_BOARD, params)
             self.board_id = self.board_shim.get_board_id()
             self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
             self.exg_channels = BoardShim.get_exg_channels(self.board_id)
             self.eeg_channels = BoardShim.get_eeg_channels(int(self.board_id))
-            self.board_shim.prepare_session()
 
-            isBoardReady = self.board_shim.is_prepared()
-            self.toggleConnected(isBoardReady, args)
-            return isBoardReady
+            # prepare_session and streaming run on the acquisition thread
+            if self.acquisition is not None:
+                self.qualityMonitor.stop()
+                self.acquisition.stop()
+            self.acquisition = AcquisitionService(self.board_shim, profiler=self.profiler)
+            self.acquisition.connected.connect(self.toggleConnected)
+            self.acquisition.replayFinished.connect(self.show_replay_finished)
+            self.qualityMonitor = SignalQualityMonitor(self.acquisition, self.exg_channels,
+                                                       BoardShim.get_package_num_channel(self.board_id),
+                                                       self.profiler)
+            self.qualityMonitor.statusChanged.connect(self.show_signal_status)
+            if args.replay_file and not args.replay_speed:
+                # Max speed replay, hand out the next chunk as soon as the pages have read the last one
+                self.acquisition.start(args.streamer_params, poll_interval_ms=0, paced=True)
+            else:
+                self.acquisition.start(args.streamer_params)
         except BaseException:
-            self.toggleConnected(False, args)
+            self.toggleConnected(False)
             logging.warning('Exception', exc_info=True)
         
 
     # Change label to notify user that the headset is connected
-    def toggleConnected(self, isConnected, args):
+    def toggleConnected(self, isConnected):
         if isConnected == True:
             self.statusLabel.setText("Connected")
             self.statusLabel.setStyleSheet("color: green;")
-            self.board_shim.start_stream(45000, args.streamer_params)
         else:
             self.statusLabel.setText("Connection Failed!")
             self.statusLabel.setStyleSheet("color: red;")
+        self.headsetConnected.emit(isConnected)
+
+
+    # A --replay-once replay has streamed the whole recording
+    def show_replay_finished(self):
+        self.statusLabel.setText("Replay finished")
+        self.statusLabel.setStyleSheet("color: yellow;")
+
+
+    # Summarize the signal quality of all channels next to the headset status
+    def show_signal_status(self, quality):
+        status = quality['status']
+        num_good = int(np.count_nonzero(status == GOOD))
+        text = "Signal: " + str(num_good) + "/" + str(len(status)) + " good"
+        if quality['dropped_packets'] > 0:
+            text += ", " + str(quality['dropped_packets']) + " dropped packets"
+        self.signalLabel.setText(text)
+        if np.any(status == BAD):
+            self.signalLabel.setStyleSheet("color: red;")
+        elif np.any(status == WARN):
+            self.signalLabel.setStyleSheet("color: yellow;")
+        else:
+            self.signalLabel.setStyleSheet("color: green;")
 
 
     # Toggle to next page in stacked layout
     def next_tab(self):
-        self.timer.stop()
         if self.stacklayout.currentIndex() == 1:
             self.button_layout.removeWidget(self.nextButton)
             self.button_layout.addWidget(self.backButton)
@@ -202,15 +267,34 @@ class MainWindow(QMainWindow):
         if self.stacklayout.currentIndex() == 2:
             self.headset_status_layout.addWidget(self.connectLabel)
             self.headset_status_layout.addWidget(self.statusLabel)
+            self.headset_status_layout.addWidget(self.signalLabel)
         if self.stacklayout.currentIndex() != self.lastIndex:
             self.stacklayout.setCurrentIndex(self.stacklayout.currentIndex()+1)
+        self.scheduler.activate(self.stacklayout.currentWidget())
 
 
     # Toggle to previous page in stacked layout
     def previous_tab(self):
-        self.timer.stop()
         if self.stacklayout.currentIndex() != 1:
             self.stacklayout.setCurrentIndex(self.stacklayout.currentIndex()-1)
+        self.scheduler.activate(self.stacklayout.currentWidget())
+
+    # Stop the acquisition thread and release the board on exit
+    def closeEvent(self, event):
+        self.scheduler.stop_all()
+        if self.acquisition is not None:
+            self.qualityMonitor.stop()
+            self.acquisition.stop()
+        super().closeEvent(event)
+
+    # Save the recorded stage timings for chrome://tracing or Perfetto
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Trace", "trace.json", "Trace (*.json)")
+        if path:
+            try:
+                self.profiler.export_chrome_trace(path)
+            except OSError:
+                logging.warning('Exception', exc_info=True)
 
     # Show pop up window with help
     def show_help_window(self):
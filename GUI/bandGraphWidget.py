@@ -10,7 +10,9 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QWidget,
 )
-from brainflow.data_filter import DataFilter, FilterTypes, DetrendOperations
+from signalFilters import StreamingFilterChain, design_bandpass, design_bandstop
+from slidingSpectrum import FREQUENCY_BANDS, TOTAL_RANGE, SlidingBandPower, frequency_bins
+
 
 # Graphs for bands
 class Graph(pg.GraphicsLayoutWidget):
@@ -20,7 +22,9 @@ class Graph(pg.GraphicsLayoutWidget):
         self.i = 0
         self.increasing = True
         self.update_speed_ms = 250
-        self.buffer = []
+        # New band values every hop_ms, the bars show the mean of the last smoothing_hops
+        self.hop_ms = 250
+        self.smoothing_hops = 5
         super().__init__()
 
     def start_collection(self):
@@ -34,6 +38,7 @@ class Graph(pg.GraphicsLayoutWidget):
         self.window_size = 1
         self.time_period = 1
         self.num_points = self.time_period * self.parentSelf.sampling_rate
+        self._init_filters()
 
         self.x = np.arange(1)
         self.y1 = np.array([1])
@@ -53,8 +58,8 @@ class Graph(pg.GraphicsLayoutWidget):
 
         self.plotSelf.isCollecting = True
         self.plotSelf.isGraphing = True
-        self.parentSelf.timer.timeout.connect(self.update)
-        self.parentSelf.timer.start(self.update_speed_ms)
+        self.parentSelf.scheduler.register(self.plotSelf, 'band_graph', self.update, self.update_speed_ms)
+        self.parentSelf.scheduler.start(self.plotSelf, 'band_graph')
         self.plotSelf.feedButton.setText('Pause Feed')
         self.plotSelf.feedButton.setStyleSheet("""
             background-color: orange;
@@ -84,40 +89,21 @@ class Graph(pg.GraphicsLayoutWidget):
         #collect data here
         #4 differnet bandwidths
         #smooth data based on last few data points 
-        data = self.parentSelf.board_shim.get_current_board_data(self.num_points)
-        self.sample_rate = self.parentSelf.sampling_rate
-        self.eeg_channels = list(range(len(self.parentSelf.exg_channels)))
-        #data = self.normalize(data)
-        data = self.preformBandPass(data, self.eeg_channels, self.sample_rate, 1, 55, 60)
-        data = data[:len(self.eeg_channels)]
-        datafft = self.preformFFT(data)
-        
-
-        max = len(datafft[0])
-        """if max > 60:
-            max = 60"""
-        max = 31
-        dataTrunck = datafft[:max]
-        #Delta: 1-4
-        delta = self.averageRelativePowerBand(dataTrunck, 0, 4, max)
-        #Theta: 4-8
-        theta = self.averageRelativePowerBand(dataTrunck, 4, 8, max)
-        #Alpha: 8-13
-        alpha = self.averageRelativePowerBand(dataTrunck, 8, 13, max)
-        #Beta: 13-30
-        beta = self.averageRelativePowerBand(dataTrunck, 13, 30, max)
-        #Gamma: 30 - 100?
-        #gamma = self.averageRelativePowerBand(dataTrunck, 30, max, max)
-
-        self.buffer.append([delta, theta, alpha, beta])
-
-        nowValue = self.rollingFilter(5)
+        profiler = self.parentSelf.profiler
+        with profiler.stage('band_graph.read'):
+            new_data, self.cursor = self.parentSelf.acquisition.get_data_since(self.cursor, self)
+        with profiler.stage('band_graph.filter'):
+            filtered = self.filter_chain.process(new_data[self.parentSelf.exg_channels])
+        with profiler.stage('band_graph.bandpower'):
+            self.band_power.write(filtered)
+            nowValue = self.band_power.smoothed()
 
         #print(delta+theta+alpha+beta)
-        self.bg1.setOpts(height=nowValue[0])
-        self.bg2.setOpts(height=nowValue[1])
-        self.bg3.setOpts(height=nowValue[2])
-        self.bg4.setOpts(height=nowValue[3])
+        with profiler.stage('band_graph.plot'):
+            self.bg1.setOpts(height=nowValue[0])
+            self.bg2.setOpts(height=nowValue[1])
+            self.bg3.setOpts(height=nowValue[2])
+            self.bg4.setOpts(height=nowValue[3])
         #self.bg5.setOpts(height=gamma)
 
         #self.printAllChannels(datafft)
@@ -125,9 +111,6 @@ class Graph(pg.GraphicsLayoutWidget):
         #self.bg2.setOpts(height=np.random.randint(10, size=(1)))
 
 
-
-        self.parentSelf.app.processEvents()
-
     def printAllChannels(self, data):
         df = pd.DataFrame(data)
         for num, channel in enumerate(data):
@@ -136,62 +119,37 @@ class Graph(pg.GraphicsLayoutWidget):
             plt.savefig(f'Fourier_DataCleanUp/indivChannel/{str(num)}.png')
         pass
 
-    def rollingFilter(self, window):
-        if len(self.buffer) > window:
-            self.buffer.pop(0)
-        
-        averages = []
-        bandwidths = np.transpose(self.buffer)
-        for bandwidth in bandwidths:
-            averages.append(np.average(bandwidth))
-        return averages
-
-    def averageRelativePowerBand(self, data, low, high, maximum):
-        #dataFFT = runFFT(data)
-        allbandpower = []
-        for channel in data:
-            allbandpower.append(self.channelRelativePowerBand(channel, low, high, maximum))
-        return np.average(allbandpower)
-
-
-    def channelRelativePowerBand(self, data, low, high, maximum):
-        bandpower = np.trapz(data[low:high+1])
-        totalband = np.trapz(data[:maximum])
-        if totalband != 0.0:
-            bandpower /= totalband
-        else:
-            return 0.0
-        return bandpower
-
     def printSingleChannel(self, data, low, high):
         df = pd.DataFrame(data)
         plt.figure()
         df.plot(subplots=True)
         plt.savefig(f'Fourier_DataCleanUp/singleChannel/{str(low)}_{str(high)}.png')
 
-    def preformFFT(self, data):
-        fftData = []
-        for channel in range(len(data)):
-            allFFT = np.fft.fft(data[channel])
-            fftData.append(abs(allFFT[:len(allFFT)//2]))
-        fftData = np.array(fftData)
-        return fftData
-
     def normalize(self, data):
         data -= np.mean(data)  # normalize data
         data /= np.std(data)
         print(data.shape)
         return data
 
-    def preformBandPass(self, data, channels, sampling_rate, start, end, cutoff):
-        for channel in channels:
-            centerFreq = (start + end) / 2.0;
-            bandWidth = end - start;
-            DataFilter.detrend(data[channel], DetrendOperations.CONSTANT.value)
-            DataFilter.perform_bandpass(data[channel], sampling_rate, centerFreq, bandWidth, 2, FilterTypes.BUTTERWORTH.value, 0.0);
-            DataFilter.perform_bandpass(data[channel], sampling_rate, centerFreq, bandWidth, 2, FilterTypes.BUTTERWORTH.value, 0.0);
-            DataFilter.perform_bandstop(data[channel], sampling_rate, cutoff, 4.0, 2, FilterTypes.BUTTERWORTH.value, 0.0);
-        return data
+    # Streaming 1-55 Hz band pass (twice) and 60 Hz notch over the EXG channels
+    # Only samples that arrived since the last tick are filtered, and the sliding
+    # band power estimator only transforms the samples that moved the window
+    def _init_filters(self, start=1, end=55, cutoff=60):
+        sampling_rate = self.parentSelf.sampling_rate
+        num_channels = len(self.parentSelf.exg_channels)
+        centerFreq = (start + end) / 2.0
+        bandWidth = end - start
+        self.filter_chain = StreamingFilterChain([
+            design_bandpass(sampling_rate, centerFreq, bandWidth, 2),
+            design_bandpass(sampling_rate, centerFreq, bandWidth, 2),
+            design_bandstop(sampling_rate, cutoff, 4.0, 2),
+        ], num_channels)
+        hop_samples = sampling_rate * self.hop_ms // 1000
+        bands = frequency_bins(FREQUENCY_BANDS, sampling_rate, self.num_points)
+        total_band = frequency_bins([TOTAL_RANGE], sampling_rate, self.num_points)[0]
+        self.band_power = SlidingBandPower(num_channels, self.num_points, hop_samples, bands, total_band,
+                                           history_length=self.smoothing_hops)
+        self.cursor = self.parentSelf.acquisition.cursor(self.num_points, self)
 
 
 # Page to show the different frequency bands
@@ -242,7 +200,7 @@ class BandGraphWidget(QWidget):
     def controlFeed(self):
         if self.isCollecting:
             if self.isGraphing:
-                self.parentSelf.timer.stop()
+                self.parentSelf.scheduler.stop(self, 'band_graph')
                 self.isGraphing = False
                 self.feedButton.setText('Resume Feed')
                 self.feedButton.setStyleSheet("""
@@ -259,7 +217,7 @@ class BandGraphWidget(QWidget):
                     margin: 1em 10em;
                 """)
             else:
-                self.parentSelf.timer.start(self.update_speed_ms)
+                self.parentSelf.scheduler.start(self, 'band_graph')
                 self.isGraphing = True
                 self.feedButton.setText('Pause Feed')
                 self.feedButton.setStyleSheet("""
@@ -0,0 +1,75 @@
+import numpy as np
+
+# Integrators already built, keyed by frequency grid, bands and frequency range
+_integrators = {}
+
+
+# Weights w such that w @ y is the Simpson integral of y (unit spacing) for any y of length n
+# An even number of points uses scipy's old integrate.simps(even='avg') rule, which the
+# features and TRAIN_STD were computed with: the mean of Simpson over the first n-1 points
+# plus a trapezoid on the last interval, and a trapezoid on the first interval plus Simpson
+# over the last n-1 points. Built in NumPy so results don't depend on the scipy version
+def simpson_weights(n):
+    weights = np.zeros(n)
+    if n < 2:
+        return weights
+    if n % 2 == 1:
+        return _odd_simpson_weights(n)
+    odd_weights = _odd_simpson_weights(n - 1)
+    weights[:-1] += odd_weights
+    weights[-2:] += 0.5
+    weights[1:] += odd_weights
+    weights[:2] += 0.5
+    return weights / 2.0
+
+
+# Composite Simpson weights 1 4 2 4 ... 2 4 1 / 3 for an odd number of points
+def _odd_simpson_weights(n):
+    weights = np.ones(n)
+    weights[1:-1:2] = 4.0
+    weights[2:-1:2] = 2.0
+    if n == 1:
+        weights[0] = 0.0
+    return weights / 3.0
+
+
+# Integrates PSDs over a set of bands with one matrix product
+# Built once per frequency grid: each band gets a row of Simpson weights over the
+# bins that fall inside both the band and the optional (low, high) frequency range
+class BandIntegrator:
+    def __init__(self, frequencies, bands, frequency_range=None):
+        in_range = np.ones(len(frequencies), dtype=bool)
+        if frequency_range is not None:
+            in_range = np.logical_and(frequencies >= frequency_range[0], frequencies <= frequency_range[1])
+
+        self.weights = np.zeros((len(bands), len(frequencies)))
+        for i, (start_freq, end_freq) in enumerate(bands):
+            band_idx = np.flatnonzero(in_range & (frequencies >= start_freq) & (frequencies <= end_freq))
+            # A band needs at least two bins to integrate, otherwise it stays 0
+            if len(band_idx) > 1:
+                self.weights[i, band_idx] = simpson_weights(len(band_idx))
+
+        self.total_weights = np.zeros(len(frequencies))
+        range_idx = np.flatnonzero(in_range)
+        if len(range_idx) > 1:
+            self.total_weights[range_idx] = simpson_weights(len(range_idx))
+
+    # (..., bins) psds -> (..., bands) absolute band powers
+    def band_powers(self, psds):
+        return psds @ self.weights.T
+
+    # (..., bins) psds -> (..., bands) band powers relative to the power in the range
+    def relative_band_powers(self, psds):
+        total_power = psds @ self.total_weights
+        return self.band_powers(psds) / total_power[..., np.newaxis]
+
+
+# Shared integrator for a frequency grid, built on first use
+def band_integrator(frequencies, bands, frequency_range=None):
+    key = (len(frequencies), float(frequencies[0]), float(frequencies[-1]),
+           tuple(map(tuple, bands)), frequency_range)
+    integrator = _integrators.get(key)
+    if integrator is None:
+        integrator = BandIntegrator(frequencies, bands, frequency_range)
+        _integrators[key] = integrator
+    return integrator
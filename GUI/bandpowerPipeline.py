@@ -0,0 +1,103 @@
+import numpy as np
+from bandPower import band_integrator, simpson_weights
+from signalFilters import apply_filters, design_bandpass, design_bandstop
+from spectralEngine import compute_psds
+
+EEG_BANDS = [
+    [0, 4],  # Delta
+    [4, 7],  # Theta
+    [7, 12],  # Alpha
+    [12, 30],  # Beta
+    [30, 50]  # Gamma
+]
+
+
+# Center and filter every channel of a recording in one call
+def filter_recording(data, sampling_rate, filter_sixty_hz, filter_zero_to_five_hz):
+    sos_list = []
+    if filter_sixty_hz:
+        sos_list.append(design_bandstop(sampling_rate, 60, 4, 2))
+    if filter_zero_to_five_hz:
+        band_pass_min = 5
+        band_pass_max = 125
+        center_freq = (band_pass_min + band_pass_max) / 2.0
+        band_width = band_pass_max - band_pass_min
+        sos_list.append(design_bandpass(sampling_rate, center_freq, band_width, 2))
+    centered = data - np.mean(data, axis=1, keepdims=True)
+    return apply_filters(centered, sos_list)
+
+
+# Keep only the bins inside frequency_range, a (low, high) pair or None for all
+def cut_frequency_range(frequencies, psds, frequency_range):
+    if frequency_range is None:
+        return frequencies, psds
+    band_idx = np.logical_and(frequencies >= frequency_range[0], frequencies <= frequency_range[1])
+    return frequencies[band_idx], psds[:, band_idx]
+
+
+# Relative power of each EEG band, averaged over the selected channels
+def standard_band_values(frequencies, psds, frequency_range):
+    integrator = band_integrator(frequencies, EEG_BANDS, frequency_range)
+    return np.mean(integrator.relative_band_powers(psds), axis=0)
+
+
+# Channel average of the PSDs, optionally relative to each channel's total power
+def plotted_psd(psds, relative):
+    if relative:
+        psds = psds / (psds @ simpson_weights(psds.shape[-1]))[:, np.newaxis]
+    return np.mean(psds, axis=0)
+
+
+# Staged bandpower processing of the A/B recordings
+# raw -> filtered -> per-channel PSD -> electrode selection -> frequency range
+# -> band integrals / normalization
+# Every stage is cached on its inputs (the settings it uses plus the key of the stage
+# before it), so a change only reruns the stages after the setting that changed
+class BandpowerPipeline:
+    def __init__(self):
+        self.states = None
+        self.data_version = 0
+        self.cache = {}
+
+    # Recordings to process, a new recording invalidates every stage
+    def set_data(self, *states):
+        if self.states is None or any(new is not old for new, old in zip(states, self.states)):
+            self.states = states
+            self.data_version += 1
+
+    def _cached(self, stage, key, compute):
+        cached = self.cache.get(stage)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = compute()
+        self.cache[stage] = (key, value)
+        return value
+
+    # Returns [(frequencies, plotted psd)] and [band values] for every state
+    # electrodes are channel indices, frequency_range is (low, high) or None for all
+    def run(self, sampling_rate, method, welch_window_length_fraction, filter_sixty_hz,
+            filter_zero_to_five_hz, electrodes, frequency_range, relative):
+        key = (self.data_version, sampling_rate, filter_sixty_hz, filter_zero_to_five_hz)
+        filtered = self._cached('filtered', key, lambda: [
+            filter_recording(data, sampling_rate, filter_sixty_hz, filter_zero_to_five_hz)
+            for data in self.states])
+
+        key = key + (method, welch_window_length_fraction)
+        spectra = self._cached('psd', key, lambda: compute_psds(
+            filtered, sampling_rate, method, welch_window_length_fraction))
+
+        key = key + (tuple(electrodes),)
+        selected = self._cached('selection', key, lambda: [
+            (frequencies, psds[electrodes]) for frequencies, psds in spectra])
+
+        key = key + (frequency_range,)
+        cut = self._cached('frequency_range', key, lambda: [
+            cut_frequency_range(frequencies, psds, frequency_range) for frequencies, psds in selected])
+
+        band_values = self._cached('bands', key, lambda: [
+            standard_band_values(frequencies, psds, frequency_range) for frequencies, psds in selected])
+
+        plots = self._cached('normalization', key + (relative,), lambda: [
+            (frequencies, plotted_psd(psds, relative)) for frequencies, psds in cut])
+
+        return plots, band_values
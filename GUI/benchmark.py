@@ -0,0 +1,310 @@
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import scipy
+from recordingStore import RECORDING_EXTENSION, import_csv, load_recording
+from signalFilters import filter_bank
+
+# Headless benchmark of each page's signal path
+# python benchmark.py --channels 8 16 --windows 1 4 60 600 --output bench.json
+# Every path is run on synthetic data and, with --recording, on a saved recording.
+# Results (latency percentiles, peak allocation per call, samples/sec, filter bank
+# hits/misses during the timed calls) are written as JSON so runs from different
+# versions can be compared
+
+SAMPLING_RATE = 250
+PATHS = ['timeseries', 'band_graph', 'ab_bandpower', 'hand_prediction', 'movement_detection', 'multitaper']
+MULTITAPER_MODES = ['adaptive', 'fast']
+
+
+# Pink-ish noise with an alpha rhythm and 60 Hz line noise, in microvolts
+def synthetic_data(num_channels, num_samples, sampling_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(num_samples) / sampling_rate
+    noise = np.cumsum(rng.standard_normal((num_channels, num_samples)), axis=1)
+    noise -= np.mean(noise, axis=1, keepdims=True)
+    alpha = 10 * np.sin(2 * np.pi * 10 * t + rng.uniform(0, 2 * np.pi, (num_channels, 1)))
+    line = 5 * np.sin(2 * np.pi * 60 * t)
+    return noise + alpha + line
+
+
+# Tile a recording to the requested number of channels and samples
+def recorded_data(recording, num_channels, num_samples):
+    channel_idx = np.arange(num_channels) % recording.shape[0]
+    sample_idx = np.arange(num_samples) % recording.shape[1]
+    return np.ascontiguousarray(recording[channel_idx][:, sample_idx])
+
+
+def load_source(path):
+    if path.endswith(RECORDING_EXTENSION):
+        data, header = load_recording(path, mmap=False)
+        return data
+    return import_csv(path)
+
+
+# Board-shaped rows (package counter in row 0, channels from row 1) like get_current_board_data
+def board_rows(data):
+    rows = np.zeros((data.shape[0] + 1, data.shape[1]))
+    rows[1:] = data
+    return rows
+
+
+# Each setup returns (call, samples processed per call)
+
+# ElectodeVisualizerWidget: stream 50 ms of new samples through the filter chain
+# into the sweep buffer and build the scrolling view
+def setup_timeseries(data, window_samples, sampling_rate):
+    from plotRendering import SweepBuffer
+    from signalFilters import StreamingFilterChain, design_bandpass, design_bandstop
+    num_channels = data.shape[0]
+    tick_samples = max(1, sampling_rate * 50 // 1000)
+    filter_chain = StreamingFilterChain([
+        design_bandpass(sampling_rate, 51.0, 100.0, 2),
+        design_bandpass(sampling_rate, 51.0, 100.0, 2),
+        design_bandstop(sampling_rate, 50.0, 4.0, 2),
+        design_bandstop(sampling_rate, 60.0, 4.0, 2),
+    ], num_channels)
+    sweep = SweepBuffer(num_channels, window_samples, sampling_rate)
+    sweep.write(filter_chain.process(data[:, :window_samples]))
+    position = [window_samples]
+
+    def call():
+        start = position[0] % (data.shape[1] - tick_samples)
+        position[0] += tick_samples
+        sweep.write(filter_chain.process(data[:, start:start + tick_samples]))
+        return sweep.scroll_view()
+    return call, num_channels * tick_samples
+
+
+# BandGraphWidget: filter 250 ms of new samples and slide the band power window by one hop
+def setup_band_graph(data, window_samples, sampling_rate):
+    from signalFilters import StreamingFilterChain, design_bandpass, design_bandstop
+    from slidingSpectrum import FREQUENCY_BANDS, TOTAL_RANGE, SlidingBandPower, frequency_bins
+    num_channels = data.shape[0]
+    tick_samples = max(1, sampling_rate * 250 // 1000)
+    filter_chain = StreamingFilterChain([
+        design_bandpass(sampling_rate, 28.0, 54.0, 2),
+        design_bandpass(sampling_rate, 28.0, 54.0, 2),
+        design_bandstop(sampling_rate, 60.0, 4.0, 2),
+    ], num_channels)
+    bands = frequency_bins(FREQUENCY_BANDS, sampling_rate, window_samples)
+    total_band = frequency_bins([TOTAL_RANGE], sampling_rate, window_samples)[0]
+    band_power = SlidingBandPower(num_channels, window_samples, tick_samples, bands, total_band)
+    band_power.write(filter_chain.process(data[:, :window_samples]))
+    position = [window_samples]
+
+    def call():
+        start = position[0] % (data.shape[1] - tick_samples)
+        position[0] += tick_samples
+        band_power.write(filter_chain.process(data[:, start:start + tick_samples]))
+        return band_power.smoothed()
+    return call, num_channels * tick_samples
+
+
+# ABBandpowerWidget.process_bp: full pipeline on both states with nothing cached
+def setup_ab_bandpower(data, window_samples, sampling_rate, method="Welch's"):
+    from bandpowerPipeline import BandpowerPipeline
+    num_channels = data.shape[0]
+    a_data = np.ascontiguousarray(data[:, :window_samples])
+    b_data = np.ascontiguousarray(data[:, -window_samples:])
+    electrodes = list(range(num_channels))
+
+    def call():
+        pipeline = BandpowerPipeline()
+        pipeline.set_data(a_data, b_data)
+        return pipeline.run(sampling_rate, method, 0.1, True, True, electrodes, None, False)
+    return call, 2 * num_channels * window_samples
+
+
+# Hand model features of the newest window, filtered from rest
+def setup_hand_prediction(data, window_samples, sampling_rate):
+    from handFeatures import HandFeaturePipeline
+    pipeline = HandFeaturePipeline().configure(sampling_rate)
+    rows = board_rows(data[:, :pipeline.settle_samples + pipeline.window_samples])
+
+    def call():
+        return pipeline.transform_recent(rows)
+    return call, len(pipeline.channels) * rows.shape[1]
+
+
+# HandPredictionWidget.predict while streaming: filter one 50 ms hop of new samples and
+# compute the features of the window that completed (model call not included)
+def setup_movement_detection(data, window_samples, sampling_rate):
+    from handFeatures import HandFeaturePipeline
+    from movementDetector import StreamingWindows
+    pipeline = HandFeaturePipeline().configure(sampling_rate)
+    rows = board_rows(data)
+    hop_samples = max(1, sampling_rate * 50 // 1000)
+    detector = StreamingWindows(pipeline.channels, pipeline.sos_list, pipeline.window_samples,
+                                hop_samples, settle_samples=pipeline.settle_samples)
+    detector.write(rows[:, :pipeline.settle_samples + pipeline.window_samples])
+    detector.windows()
+    position = [pipeline.settle_samples + pipeline.window_samples]
+
+    def call():
+        start = position[0] % (rows.shape[1] - hop_samples)
+        position[0] += hop_samples
+        detector.write(rows[:, start:start + hop_samples])
+        return pipeline.transform(detector.windows())
+    return call, len(pipeline.channels) * hop_samples
+
+
+# multitaper.multitaper_psd on the whole window of every channel
+def setup_multitaper(data, window_samples, sampling_rate, mode='adaptive'):
+    from multitaper import multitaper_psd
+    window = np.ascontiguousarray(data[:, :window_samples])
+
+    def call():
+        return multitaper_psd(window, sampling_rate, adaptive=mode == 'adaptive', normalization='full')
+    return call, window.size
+
+
+SETUPS = {
+    'timeseries': setup_timeseries,
+    'band_graph': setup_band_graph,
+    'ab_bandpower': setup_ab_bandpower,
+    'hand_prediction': setup_hand_prediction,
+    'movement_detection': setup_movement_detection,
+    'multitaper': setup_multitaper,
+}
+
+
+# Time a call until max_calls or max_seconds, then measure its peak allocation once
+def measure(call, samples_per_call, max_calls, max_seconds):
+    call()
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < max_calls and (len(latencies) < 3 or time.perf_counter() - started < max_seconds):
+        call_start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - call_start)
+
+    tracemalloc.start()
+    call()
+    allocated_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000.0
+    return {
+        'calls': len(latencies),
+        'latency_ms': {
+            'mean': float(np.mean(latencies_ms)),
+            'p50': float(np.percentile(latencies_ms, 50)),
+            'p90': float(np.percentile(latencies_ms, 90)),
+            'p99': float(np.percentile(latencies_ms, 99)),
+            'max': float(np.max(latencies_ms)),
+        },
+        'alloc_peak_kb': allocated_peak / 1024.0,
+        'samples_per_sec': samples_per_call / (np.mean(latencies_ms) / 1000.0),
+    }
+
+
+def run_path(path, sources, channel_counts, windows, sampling_rate, max_calls, max_seconds, methods):
+    # The hand model always looks at 1.4 s (settling plus window) of electrodes 3, 4 and 7
+    if path in ('hand_prediction', 'movement_detection'):
+        windows = [1.4]
+        channel_counts = [8]
+    if path == 'multitaper':
+        methods = MULTITAPER_MODES
+    elif path != 'ab_bandpower':
+        methods = [None]
+
+    results = []
+    for source_name, recording in sources.items():
+        for num_channels in channel_counts:
+            for window_seconds in windows:
+                window_samples = int(window_seconds * sampling_rate)
+                # Room for the window plus a few seconds of streaming
+                num_samples = window_samples + 10 * sampling_rate
+                if recording is None:
+                    data = synthetic_data(num_channels, num_samples, sampling_rate)
+                else:
+                    data = recorded_data(recording, num_channels, num_samples)
+                for method in methods:
+                    if method is None:
+                        call, samples_per_call = SETUPS[path](data, window_samples, sampling_rate)
+                    else:
+                        call, samples_per_call = SETUPS[path](data, window_samples, sampling_rate, method)
+                    result = {
+                        'path': path,
+                        'method': method,
+                        'source': source_name,
+                        'channels': num_channels,
+                        'window_s': window_seconds,
+                    }
+                    # Misses here mean a filter is redesigned on every call
+                    filter_bank.reset_counters()
+                    result.update(measure(call, samples_per_call, max_calls, max_seconds))
+                    result['filter_bank'] = filter_bank.stats()
+                    results.append(result)
+                    print_result(result)
+    return results
+
+
+# Returns the results and the paths that couldn't run because a dependency is missing
+def run(paths, channel_counts, windows, sampling_rate, recording_path, max_calls, max_seconds, methods):
+    sources = {'synthetic': None}
+    if recording_path:
+        sources['recorded'] = load_source(recording_path)
+
+    results = []
+    failed = []
+    for path in paths:
+        try:
+            results += run_path(path, sources, channel_counts, windows, sampling_rate,
+                                max_calls, max_seconds, methods)
+        except ImportError as e:
+            # Every path is meant to run headless, so this is an error, not a skip
+            print('FAILED ' + path + ': ' + str(e), file=sys.stderr)
+            failed.append(path)
+    return results, failed
+
+
+def print_result(result):
+    name = result['path'] if result['method'] is None else result['path'] + ' (' + result['method'] + ')'
+    latency = result['latency_ms']
+    print('{:<28} {:<9} {:>3} ch {:>7.1f} s  p50 {:>9.3f} ms  p99 {:>9.3f} ms  {:>10.0f} KiB  {:>12.0f} samples/s'.format(
+        name, result['source'], result['channels'], result['window_s'], latency['p50'], latency['p99'],
+        result['alloc_peak_kb'], result['samples_per_sec']))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the signal path of every page without a GUI')
+    parser.add_argument('--paths', nargs='+', choices=PATHS, default=PATHS)
+    parser.add_argument('--channels', nargs='+', type=int, default=[8, 16])
+    parser.add_argument('--windows', nargs='+', type=float, default=[1, 4, 10, 60, 600],
+                        help='window lengths in seconds')
+    parser.add_argument('--methods', nargs='+', default=["Welch's", 'FFT', 'Multitaper'],
+                        help='bandpower methods for ab_bandpower')
+    parser.add_argument('--sampling-rate', type=int, default=SAMPLING_RATE)
+    parser.add_argument('--recording', type=str, default='state_raw_data/a_data.csv',
+                        help='recording for the recorded-data runs, empty to skip')
+    parser.add_argument('--max-calls', type=int, default=200)
+    parser.add_argument('--max-seconds', type=float, default=2.0, help='time budget per case')
+    parser.add_argument('--output', type=str, default='', help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    results, failed = run(args.paths, args.channels, args.windows, args.sampling_rate, args.recording,
+                  args.max_calls, args.max_seconds, args.methods)
+    if args.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'platform': platform.platform(),
+            'sampling_rate': args.sampling_rate,
+            'results': results,
+            'failed': failed,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -16,6 +16,7 @@ class ConfigureHeadsetWidget(QWidget):
         self.parentSelf = parentSelf
         self.serialPort = ''
         super().__init__()
+        self.parentSelf.headsetConnected.connect(self.connection_finished)
 
         title = QLabel("Let's connect to your headset!")
         title.setAlignment(Qt.AlignHCenter)
@@ -75,9 +76,15 @@ class ConfigureHeadsetWidget(QWidget):
         self.serialPort = p
 
     # Button trigger to connect headset
+    # The result arrives asynchronously through MainWindow.headsetConnected
     def connect(self):
         # self.parentSelf.connect_headset(self.serialPort)
-        self.isConnected = self.parentSelf.connect_headset("/dev/cu.usbserial-DM0257WW")
+        self.connectButton.setEnabled(False)
+        self.parentSelf.connect_headset("/dev/cu.usbserial-DM0257WW")
+
+    def connection_finished(self, isConnected):
+        self.isConnected = isConnected
+        self.connectButton.setEnabled(not isConnected)
         self.updateStatus()
 
     # Updates text with the connection status of the headset
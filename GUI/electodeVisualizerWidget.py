@@ -8,7 +8,11 @@ from PySide6.QtWidgets import (
     QHBoxLayout,
     QWidget,
 )
-from brainflow.data_filter import DataFilter, FilterTypes, DetrendOperations
+from plotRendering import SWEEP_BINS, DecimatedCurves, SweepBuffer
+from signalFilters import StreamingFilterChain, design_bandpass, design_bandstop
+
+# How often new samples are filtered into the plot buffer, independent of the redraw speed
+COMPUTE_SPEED_MS = 50
 
 # Graph section for page
 class Graph(pg.GraphicsLayoutWidget):
@@ -20,13 +24,16 @@ class Graph(pg.GraphicsLayoutWidget):
 
     # Start Initial Connection
     def start_collection(self):
-        self.window_size = 4
-        self.num_points = self.window_size * self.parentSelf.sampling_rate
+        self.num_points = self.plotSelf.window_size * self.parentSelf.sampling_rate
+        self._init_timeseries()
+        self._init_filters()
         self.plotSelf.isCollecting = True
         self.plotSelf.isGraphing = True
-        self._init_timeseries()
-        self.parentSelf.timer.timeout.connect(self.update)
-        self.parentSelf.timer.start(self.plotSelf.update_speed_ms)
+        scheduler = self.parentSelf.scheduler
+        scheduler.register(self.plotSelf, 'timeseries.compute', self.compute, COMPUTE_SPEED_MS)
+        scheduler.register(self.plotSelf, 'timeseries.render', self.render_frame, self.plotSelf.update_speed_ms)
+        scheduler.start(self.plotSelf, 'timeseries.compute')
+        scheduler.start(self.plotSelf, 'timeseries.render')
         self.plotSelf.feedButton.setText('Pause Feed')
         self.plotSelf.feedButton.setStyleSheet("""
             background-color: orange;
@@ -75,29 +82,73 @@ class Graph(pg.GraphicsLayoutWidget):
             p.setMenuEnabled('left', False)
             p.showAxis('bottom', False)
             p.setMenuEnabled('bottom', False)
+            p.setXRange(0, self.plotSelf.window_size, padding=0)
             pen = pg.mkPen(color=colors[i])
             self.plots.append(p)
             curve = p.plot(pen=pen)
             self.curves.append(curve)
             inRow = inRow + 1
+        self.renderer = DecimatedCurves(self.plots, self.curves)
+        self.resized = False
+        for p in self.plots:
+            p.getViewBox().sigResized.connect(self.plot_resized)
+
+    # One min/max bin per pixel column of the plots, SWEEP_BINS until they are laid out
+    # Never more bins than samples in the window, as SweepBuffer would clamp them anyway
+    def sweep_bins(self):
+        width = self.renderer.pixel_width()
+        return min(width if width > 0 else SWEEP_BINS, int(self.num_points))
+
+    # The sweep buffer is resized on the next compute tick, so a window being dragged
+    # refills it at most once per tick
+    def plot_resized(self):
+        self.resized = True
+
+    # Streaming filters and the sweep buffer of filtered samples shown in the plots
+    # 1-101 Hz band pass (twice) and 50/60 Hz notches, applied only to new samples
+    def _init_filters(self):
+        sampling_rate = self.parentSelf.sampling_rate
+        num_channels = len(self.parentSelf.exg_channels)
+        self.filter_chain = StreamingFilterChain([
+            design_bandpass(sampling_rate, 51.0, 100.0, 2),
+            design_bandpass(sampling_rate, 51.0, 100.0, 2),
+            design_bandstop(sampling_rate, 50.0, 4.0, 2),
+            design_bandstop(sampling_rate, 60.0, 4.0, 2),
+        ], num_channels)
+        self.sweep = SweepBuffer(num_channels, self.num_points, sampling_rate, self.sweep_bins())
+        # Start with the last window of samples already in the buffer
+        self.cursor = self.parentSelf.acquisition.cursor(self.num_points, self)
+
+    # Filter the samples that arrived since the last tick into the sweep buffer
+    def compute(self):
+        profiler = self.parentSelf.profiler
+        if self.resized:
+            self.resized = False
+            if self.sweep_bins() != self.sweep.num_bins:
+                self._init_filters()
+        with profiler.stage('timeseries.read'):
+            new_data, self.cursor = self.parentSelf.acquisition.get_data_since(self.cursor, self)
+        with profiler.stage('timeseries.filter'):
+            self.sweep.write(self.filter_chain.process(new_data[self.parentSelf.exg_channels]))
+
+    # Add the filtered samples to graphs
+    def render_frame(self):
+        with self.parentSelf.profiler.stage('timeseries.plot'):
+            # plot timeseries, only the bins of the new samples have changed
+            if self.plotSelf.sweep_mode:
+                x, y = self.sweep.sweep_view()
+            else:
+                x, y = self.sweep.scroll_view()
+            self.renderer.set_xy(x, y)
 
-    # Get current board data and add to graphs
-    def update(self):
-        data = self.parentSelf.board_shim.get_current_board_data(self.num_points)
-        for count, channel in enumerate(self.parentSelf.exg_channels):
-            # plot timeseries
-            DataFilter.detrend(data[channel], DetrendOperations.CONSTANT.value)
-            DataFilter.perform_bandpass(data[channel], self.parentSelf.sampling_rate, 51.0, 100.0, 2,
-                                        FilterTypes.BUTTERWORTH.value, 0)
-            DataFilter.perform_bandpass(data[channel], self.parentSelf.sampling_rate, 51.0, 100.0, 2,
-                                        FilterTypes.BUTTERWORTH.value, 0)
-            DataFilter.perform_bandstop(data[channel], self.parentSelf.sampling_rate, 50.0, 4.0, 2,
-                                        FilterTypes.BUTTERWORTH.value, 0)
-            DataFilter.perform_bandstop(data[channel], self.parentSelf.sampling_rate, 60.0, 4.0, 2,
-                                        FilterTypes.BUTTERWORTH.value, 0)
-            self.curves[count].setData(data[channel].tolist())
-
-        self.parentSelf.app.processEvents()
+    # Change the window length, the visible window is refilled from the shared buffer
+    def set_window_size(self, seconds):
+        if not self.plotSelf.isCollecting:
+            return
+        self.num_points = seconds * self.parentSelf.sampling_rate
+        self._init_filters()
+        for p in self.plots:
+            p.setXRange(0, seconds, padding=0)
 
 
 # Page to show live feeds from all electrodes
@@ -105,6 +156,8 @@ class ElectodeVisualizerWidget(QWidget):
     def __init__(self, parentSelf):
         self.parentSelf = parentSelf
         self.update_speed_ms = 50
+        self.window_size = 4
+        self.sweep_mode = False
         self.isCollecting = False
         self.isGraphing = False
         super().__init__()
@@ -145,6 +198,21 @@ class ElectodeVisualizerWidget(QWidget):
             color: #fff;
         """)
         timeList.currentIndexChanged.connect(self.time_index_changed)
+        windowList = QComboBox()
+        windowList.setPlaceholderText("Window Length (s)")
+        windowList.addItems(["4", "10", "20", "30", "60"])
+        windowList.setStyleSheet("""
+            background-color: gray;
+            color: #fff;
+        """)
+        windowList.currentIndexChanged.connect(self.window_index_changed)
+        modeList = QComboBox()
+        modeList.addItems(["Scroll", "Sweep"])
+        modeList.setStyleSheet("""
+            background-color: gray;
+            color: #fff;
+        """)
+        modeList.currentIndexChanged.connect(self.mode_index_changed)
 
         pageLayout = QVBoxLayout()
         self.title_layout = QHBoxLayout()
@@ -155,6 +223,8 @@ class ElectodeVisualizerWidget(QWidget):
         self.title_layout.addWidget(self.feedButton)
         self.dropdown_layout.addWidget(graphLabel)
         self.dropdown_layout.addWidget(timeList)
+        self.dropdown_layout.addWidget(windowList)
+        self.dropdown_layout.addWidget(modeList)
         self.graph = Graph(self, self.parentSelf)
         pageLayout.addWidget(self.graph)
         self.setLayout(pageLayout)
@@ -164,7 +234,8 @@ class ElectodeVisualizerWidget(QWidget):
     def controlFeed(self):
         if self.isCollecting:
             if self.isGraphing:
-                self.parentSelf.timer.stop()
+                self.parentSelf.scheduler.stop(self, 'timeseries.compute')
+                self.parentSelf.scheduler.stop(self, 'timeseries.render')
                 self.isGraphing = False
                 self.feedButton.setText('Resume Feed')
                 self.feedButton.setStyleSheet("""
@@ -181,7 +252,8 @@ class ElectodeVisualizerWidget(QWidget):
                     margin: 1em 10em;
                 """)
             else:
-                self.parentSelf.timer.start(self.update_speed_ms)
+                self.parentSelf.scheduler.start(self, 'timeseries.compute')
+                self.parentSelf.scheduler.start(self, 'timeseries.render')
                 self.isGraphing = True
                 self.feedButton.setText('Pause Feed')
                 self.feedButton.setStyleSheet("""
@@ -203,4 +275,16 @@ class ElectodeVisualizerWidget(QWidget):
     # Change how quickly graph updates
     def time_index_changed(self, i):
         times = [1, 10, 50, 100, 500, 1000]
-        self.parentSelf.timer.setInterval( times[i] )
\ No newline at end of file
+        self.update_speed_ms = times[i]
+        if self.isCollecting:
+            self.parentSelf.scheduler.set_interval(self, 'timeseries.render', self.update_speed_ms)
+
+    # Change how many seconds the graph shows
+    def window_index_changed(self, i):
+        windows = [4, 10, 20, 30, 60]
+        self.window_size = windows[i]
+        self.graph.set_window_size(self.window_size)
+
+    # Scroll the window to the left or sweep across it like an ECG monitor
+    def mode_index_changed(self, i):
+        self.sweep_mode = i == 1
@@ -9,6 +9,7 @@ from PySide6.QtWidgets import (
     QWidget,
 )
 from PySide6.QtGui import QPixmap
+from signalQuality import quality_flags
 
 # Page to ensure the electrodes are making proper contact with the scalp
 class ElectrodeConnectivityWidget(QWidget):
@@ -170,6 +171,34 @@ class ElectrodeConnectivityWidget(QWidget):
         rightLayout.addWidget(electrodeEight,7,0)
         rightLayout.addWidget(electrodeEightStatus,7,1)
 
+        # Electrodes 9-16, only shown for 16 channel boards
+        extraLayout = QGridLayout()
+        bodyLayout.addLayout(extraLayout)
+        extraLayout.addWidget(electrodeNine,0,0)
+        extraLayout.addWidget(electrodeNineStatus,0,1)
+        extraLayout.addWidget(electrodeTen,1,0)
+        extraLayout.addWidget(electrodeTenStatus,1,1)
+        extraLayout.addWidget(electrodeEleven,2,0)
+        extraLayout.addWidget(electrodeElevenStatus,2,1)
+        extraLayout.addWidget(electrodeTwelve,3,0)
+        extraLayout.addWidget(electrodeTwelveStatus,3,1)
+        extraLayout.addWidget(electrodeThirteen,4,0)
+        extraLayout.addWidget(electrodeThirteenStatus,4,1)
+        extraLayout.addWidget(electrodeFourteen,5,0)
+        extraLayout.addWidget(electrodeFourteenStatus,5,1)
+        extraLayout.addWidget(electrodeFifteen,6,0)
+        extraLayout.addWidget(electrodeFifteenStatus,6,1)
+        extraLayout.addWidget(electrodeSixteen,7,0)
+        extraLayout.addWidget(electrodeSixteenStatus,7,1)
+        self.extraElectrodes = [
+            electrodeNine, electrodeNineStatus, electrodeTen, electrodeTenStatus,
+            electrodeEleven, electrodeElevenStatus, electrodeTwelve, electrodeTwelveStatus,
+            electrodeThirteen, electrodeThirteenStatus, electrodeFourteen, electrodeFourteenStatus,
+            electrodeFifteen, electrodeFifteenStatus, electrodeSixteen, electrodeSixteenStatus
+        ]
+        for widget in self.extraElectrodes:
+            widget.hide()
+
         # rightLayout.addWidget(electrodeNine,0,0)
         # rightLayout.addWidget(electrodeNineStatus,0,1)
         # rightLayout.addWidget(electrodeTen,1,0)
@@ -189,48 +218,42 @@ class ElectrodeConnectivityWidget(QWidget):
 
         self.setLayout(pageLayout)
 
-    # Scan all electrodes every second
+    # Show the status of all electrodes every second
+    # The quality monitor looks at the last 2 seconds of every channel
     def scanElectrodes(self):
-        self.time_period = 2
-        self.num_points = self.time_period * self.parentSelf.sampling_rate
-        self.parentSelf.timer.timeout.connect(self.check_if_railed)
-        self.parentSelf.timer.start(self.update_speed_ms)
+        for widget in self.extraElectrodes:
+            widget.setVisible(len(self.parentSelf.exg_channels) > 8)
+        self.parentSelf.scheduler.register(self, 'connectivity', self.check_if_railed, self.update_speed_ms)
+        self.parentSelf.scheduler.start(self, 'connectivity')
         self.electrodeButton.setText("Scanning...")
     
-    # Find which electrodes are railed
-    def get_railed_electrodes(self, d):
-        threshold_railed = 90
-        threshold_railed_warn = 75
-        # scalar = (4.5 / (pow(2, 23) - 1) / 1.0 * 1000000.)
-        scalar = (4.5 / (pow(2, 23) - 1) / 24 * 1000000.)  # 24 is channel gain. This is 'dynamic scalar'
-        max_val = scalar * pow(2, 23)
-        n_points = self.time_period * 125
-        electrode_railed = []
-        electrode_railed_warn = []
-        for i in range(1, 9):
-            channel_data = d[i]
-            end_pos = len(channel_data)
-            start_pos = np.maximum(0, end_pos - n_points)
-            maximum = np.abs(channel_data[start_pos])
-            for j in range(end_pos):
-                if np.abs(channel_data[j]) > maximum:
-                    maximum = np.abs(channel_data[j])
-            percentage = (maximum / max_val) * 100.0
-            if percentage > threshold_railed:
-                electrode_railed.append(i)
-            if percentage > threshold_railed_warn:
-                electrode_railed_warn.append(i)
-        return electrode_railed, electrode_railed_warn
+    # Find which electrodes are railed, almost railed or flat, numbered from 1 in EXG channel order
+    # Uses the metrics the background quality monitor keeps for every EXG channel,
+    # up to the 16 in electrodeDict
+    def get_railed_electrodes(self, quality):
+        self.quality = {key: quality[key][:len(self.electrodeDict)]
+                        for key in ('peak', 'rms', 'flat_percent', 'railed_percent')}
+        railed, railed_warn, flat = quality_flags(self.quality)
+        electrode_railed = (np.flatnonzero(railed) + 1).tolist()
+        electrode_railed_warn = (np.flatnonzero(railed_warn) + 1).tolist()
+        electrode_flat = (np.flatnonzero(flat) + 1).tolist()
+        return electrode_railed, electrode_railed_warn, electrode_flat
 
     # Check if electrodes are railed, change labels for railed electrodes
     def check_if_railed(self):
-        data = self.parentSelf.board_shim.get_current_board_data(self.num_points)
-        er, erw = self.get_railed_electrodes(data)
-        for e in range(1,9):
-            if e not in erw and e not in er:
+        quality = self.parentSelf.qualityMonitor.quality
+        if quality is None:
+            return
+        er, erw, ef = self.get_railed_electrodes(quality)
+        for e in range(1, len(self.quality['peak']) + 1):
+            if e not in erw and e not in er and e not in ef:
                 self.electrodeDict[e].setText('Not Railed')
                 self.electrodeDict[e].setStyleSheet("color: green;")
                 #self.problemElectrodes.pop(e)
+        for e in ef:
+            if e not in erw:
+                self.electrodeDict[e].setText('Flat Line')
+                self.electrodeDict[e].setStyleSheet("color: orange;")
         for e in erw:
             if e not in er:
                 self.electrodeDict[e].setText('Almost Railed')
@@ -0,0 +1,288 @@
+import os
+import numpy as np
+from bandPower import simpson_weights
+from multitaper import multitaper_psd
+from signalFilters import apply_filters, filter_bank
+
+# Per-bin, per-electrode standard deviation of the training features
+TRAIN_STD = np.array([
+    [0.01476474, 0.01631246, 0.01631718],
+    [0.02620701, 0.02686283, 0.02804365],
+    [0.02044909, 0.02105626, 0.02235255],
+    [0.01677405, 0.01872686 ,0.01830245],
+    [0.01685349, 0.01871326 ,0.0182856 ],
+    [0.01664785, 0.01844743 ,0.01911868],
+    [0.01438977, 0.01741451 ,0.01976959],
+    [0.01315815, 0.01528999 ,0.02050752],
+    [0.012611  , 0.0146526  ,0.02098592],
+    [0.01177259, 0.01418756 ,0.02002651],
+    [0.01091025, 0.01413216 ,0.0196515 ],
+    [0.0100345 , 0.01353677 ,0.01824545],
+    [0.00943196, 0.01278214 ,0.01666602],
+    [0.00859619, 0.01121476 ,0.0129942 ],
+    [0.00757761, 0.00923231 ,0.00877395],
+    [0.00715873, 0.00733369 ,0.00720624],
+    [0.00691866, 0.00679066 ,0.00654214],
+    [0.0065439 , 0.00612532 ,0.00649415],
+    [0.00617699, 0.00582739 ,0.00593671],
+    [0.00606672, 0.00581866 ,0.00567298],
+    [0.00580141, 0.00557059 ,0.00542462],
+    [0.00550212, 0.00533288 ,0.00517623],
+    [0.0055653 , 0.00513437 ,0.00505187],
+    [0.00542666, 0.00495912 ,0.00507906],
+    [0.00506654, 0.00478077 ,0.00490897],
+    [0.00503117, 0.00470742 ,0.00479067],
+    [0.00506894, 0.00454103 ,0.00472174],
+    [0.004988  , 0.00468142 ,0.00487829],
+    [0.00483885, 0.00466738 ,0.00468365],
+    [0.00456471, 0.00463647 ,0.00465998],
+    [0.0044456 , 0.00457108 ,0.00450727],
+    [0.00443583, 0.00454569 ,0.00452091],
+    [0.00422836, 0.00440366 ,0.00456744],
+    [0.00424851, 0.00419822 ,0.00455142],
+    [0.00398442, 0.00400003 ,0.00431252],
+    [0.00395255, 0.00387852 ,0.00430317],
+    [0.00386372, 0.00370908 ,0.00420777],
+    [0.00376149, 0.00353131 ,0.00413788],
+    [0.00349449, 0.00340614 ,0.00387468],
+    [0.00348416, 0.00338079 ,0.00382123],
+    [0.00341332, 0.00338862 ,0.00378832],
+    [0.00328861, 0.00345155 ,0.00370163],
+    [0.00322939, 0.00346962 ,0.00362286],
+    [0.00304765, 0.00336139 ,0.0034354 ],
+    [0.00302042, 0.00330749 ,0.0033357 ],
+    [0.00282179, 0.00324208 ,0.00319523],
+    [0.00282012, 0.00323532 ,0.0032489 ],
+    [0.00258887, 0.0030305  ,0.00297817],
+    [0.00260791, 0.00296263 ,0.00306391],
+    [0.00250922, 0.00280417 ,0.00294357],
+    [0.00242332, 0.00276005 ,0.00283524],
+    [0.00235729, 0.00261534 ,0.0027464 ],
+    [0.00217427, 0.00235471 ,0.00250529],
+    [0.001888  , 0.00207419 ,0.00215566],
+    [0.00157358, 0.00170387 ,0.00179604],
+    [0.00133257, 0.00133964 ,0.00142254],
+    [0.00114733, 0.00109454 ,0.00117748],
+    [0.00087214, 0.00079859 ,0.00085146],
+    [0.00054932, 0.00053114 ,0.00051695],
+    [0.00027825, 0.00024193 ,0.00024499],
+    [0.0001955 , 0.00013014 ,0.00015771],
+    [0.00027986, 0.00019677 ,0.00021665],
+    [0.00048702, 0.00037219 ,0.00039031],
+    [0.00067456, 0.00052766 ,0.00057637],
+    [0.00102222, 0.00071474 ,0.00086084],
+    [0.00115356, 0.00090195 ,0.00104168],
+    [0.00115935, 0.0010568  ,0.00116886],
+    [0.00207372, 0.0014003  ,0.00151503],
+    [0.0022074 , 0.00152946 ,0.00165126],
+    [0.00226483, 0.00160395 ,0.00173882],
+    [0.00233362, 0.00170726 ,0.00182778],
+    [0.00235195, 0.00171512 ,0.00182902],
+    [0.00235087, 0.00174036 ,0.0018829 ],
+    [0.00224077, 0.00168372 ,0.0018542 ],
+    [0.00193064, 0.00170197 ,0.00182041],
+    [0.00161717, 0.00170774 ,0.00182212],
+    [0.00152008, 0.00164595 ,0.00174044],
+    [0.00155375, 0.00166774 ,0.00174443],
+    [0.00160103, 0.00169811 ,0.00174424],
+    [0.00155086, 0.00169602 ,0.0016872 ],
+    [0.00155638, 0.00169796 ,0.00167004],
+    [0.00156257, 0.00170149 ,0.00165233],
+    [0.00147267, 0.00159182 ,0.00152674],
+    [0.00140802, 0.00152442 ,0.00148874],
+    [0.00132605, 0.00151323 ,0.00144341],
+    [0.00134809, 0.00150129 ,0.0014931 ],
+    [0.00131266, 0.00145235 ,0.00146463],
+    [0.00126366, 0.00137945 ,0.00141568],
+    [0.00119536, 0.00132739 ,0.001353  ],
+    [0.00111695, 0.00120929 ,0.00129041],
+    [0.00105399, 0.00111511 ,0.00122668],
+    [0.00096263, 0.00103437 ,0.00116186],
+    [0.00089893, 0.0009684  ,0.00106862],
+    [0.00084244, 0.00090962 ,0.00100892],
+    [0.00081701, 0.00087116 ,0.00096164],
+    [0.00074428, 0.00079878 ,0.000885  ],
+    [0.00070537, 0.0007724  ,0.00082168],
+    [0.00064852, 0.00073278 ,0.00074008],
+    [0.0006129 , 0.00070892 ,0.00070441],
+    [0.00058877, 0.00068412 ,0.00068019],
+    [0.00059084, 0.00066943 ,0.00066649],
+    [0.00056798, 0.00063915 ,0.00065088],
+    [0.00054041, 0.00063198 ,0.0006424 ],
+    [0.00052098, 0.0006301  ,0.00063775],
+    [0.00051996, 0.00064545 ,0.00065343],
+    [0.0004894 , 0.00061979 ,0.00061901],
+    [0.00048858, 0.00061096 ,0.00060581],
+    [0.00047422, 0.00056547 ,0.00058244],
+    [0.00046152, 0.00055193 ,0.00056345],
+    [0.00046204, 0.00054823 ,0.00054971],
+    [0.00046074, 0.00053461 ,0.00053619],
+    [0.00046125, 0.00050899 ,0.00052091],
+    [0.00044409, 0.00048805 ,0.00049713],
+    [0.00042432, 0.00047766 ,0.00049429],
+    [0.00041436, 0.0004812  ,0.00048796],
+    [0.00042557, 0.00047934 ,0.00049906],
+    [0.0004624 , 0.00048543 ,0.00051518],
+    [0.00056137, 0.00051641 ,0.00057718],
+    [0.00055948, 0.00050355 ,0.00057889],
+    [0.00055622, 0.00049523 ,0.00057238],
+    [0.00054586, 0.00047975 ,0.0005588 ],
+    [0.00053044, 0.00046093 ,0.00055582],
+    [0.00054408, 0.00047611 ,0.00055358],
+    [0.0005475 , 0.00048938 ,0.00055586],
+    [0.00044007, 0.00047332 ,0.00048086],
+    [0.00023027, 0.00024807 ,0.00024619]
+])
+
+# Electrodes 3, 4 and 7 feed the model
+DEFAULT_CHANNELS = (2, 3, 6)
+# (type, low Hz, high Hz, order) for signalFilters.filter_bank: a 60 Hz band stop, then the
+# 2-125 Hz band pass the model was trained with. At 250 Hz that band pass reaches Nyquist and
+# was designed as a 2 Hz high pass, so it is stored as one to respond the same at any rate
+DEFAULT_FILTERS = (('bandstop', 55.0, 65.0, 2), ('highpass', 2.0, 125.0, 2))
+# One second windows, after 0.4 s for the filters to settle when starting from rest
+WINDOW_SECONDS = 1.0
+SETTLE_SECONDS = 0.4
+# 1 Hz bins from 0 to 125 Hz, one row of TRAIN_STD each
+FREQUENCY_RANGE = (0.0, 125.0)
+HALF_BANDWIDTH = 4.0
+# Peak amplitude in µV above which a window is probably muscle interference
+BAD_AMPLITUDE = 100.0
+# Saved next to the model: rbmeotmd1.keras -> rbmeotmd1.features.npz
+FEATURES_EXTENSION = '.features.npz'
+
+
+# Everything that turns raw samples into finger-movement model inputs
+# Channel selection, filter specs, multitaper settings, the frequency bins and the training
+# statistics are kept together and saved next to the model, so the model always gets the
+# features it was trained on. Filters, window lengths and bins are derived for the board's
+# sampling rate in configure(), which also precomputes the Simpson weights of the total
+# power and 1 / TRAIN_STD; transform() then writes into preallocated output arrays
+class HandFeaturePipeline:
+    def __init__(self, channels=DEFAULT_CHANNELS, filters=DEFAULT_FILTERS, window_seconds=WINDOW_SECONDS,
+                 settle_seconds=SETTLE_SECONDS, frequency_range=FREQUENCY_RANGE, half_bandwidth=HALF_BANDWIDTH,
+                 adaptive=True, bad_amplitude=BAD_AMPLITUDE, train_std=TRAIN_STD):
+        self.channels = np.array(channels, dtype=np.intp)
+        self.filters = [(str(filter_type), float(low), float(high), int(order))
+                        for filter_type, low, high, order in filters]
+        self.window_seconds = float(window_seconds)
+        self.settle_seconds = float(settle_seconds)
+        self.frequency_range = (float(frequency_range[0]), float(frequency_range[1]))
+        self.half_bandwidth = float(half_bandwidth)
+        self.adaptive = bool(adaptive)
+        self.bad_amplitude = float(bad_amplitude)
+        # (bins x channels), None for unnormalized features
+        self.train_std = None
+        if train_std is not None:
+            self.train_std = np.array(train_std, dtype=np.float64)
+            self.scale = 1.0 / self.train_std
+        self.sampling_rate = None
+
+    # Settings other than the training statistics, as keyword arguments for the constructor
+    def config(self):
+        return {
+            'channels': [int(channel) for channel in self.channels],
+            'filters': [list(spec) for spec in self.filters],
+            'window_seconds': self.window_seconds,
+            'settle_seconds': self.settle_seconds,
+            'frequency_range': list(self.frequency_range),
+            'half_bandwidth': self.half_bandwidth,
+            'adaptive': self.adaptive,
+            'bad_amplitude': self.bad_amplitude,
+        }
+
+    # Derive the sampling rate dependent parts, does nothing if already set up for this rate
+    def configure(self, sampling_rate):
+        if sampling_rate == self.sampling_rate:
+            return self
+        if self.frequency_range[1] > sampling_rate / 2.0:
+            raise ValueError('Features go up to ' + str(self.frequency_range[1]) + ' Hz, a sampling rate of '
+                             + str(sampling_rate) + ' Hz is too low')
+        window_samples = int(round(self.window_seconds * sampling_rate))
+        frequencies = np.fft.rfftfreq(window_samples, 1.0 / sampling_rate)
+        num_bins = np.count_nonzero((frequencies >= self.frequency_range[0]) & (frequencies <= self.frequency_range[1]))
+        if self.train_std is None:
+            self.scale = np.ones((num_bins, len(self.channels)))
+        elif num_bins != len(self.train_std):
+            raise ValueError(str(num_bins) + ' frequency bins at ' + str(sampling_rate) + ' Hz, the model expects '
+                             + str(len(self.train_std)))
+
+        self.sampling_rate = sampling_rate
+        self.window_samples = window_samples
+        self.settle_samples = int(round(self.settle_seconds * sampling_rate))
+        self.sos_list = [filter_bank.get(sampling_rate, *spec) for spec in self.filters]
+        # Full bandwidth in Hz that gives half_bandwidth for this window length
+        self.bandwidth = 2.0 * self.half_bandwidth * sampling_rate / window_samples
+        self.total_weights = simpson_weights(num_bins)
+        self._allocate(1)
+        return self
+
+    def _allocate(self, batch_size):
+        num_bins, num_channels = self.scale.shape
+        self.features = np.empty((batch_size, 1, num_bins, num_channels))
+        self.totals = np.empty((batch_size, num_channels))
+        self.bad = np.empty(batch_size, dtype=bool)
+
+    # (windows x channels x window_samples) filtered windows -> ((windows x 1 x bins x channels)
+    # features, (windows) mask of windows that looked like muscle interference)
+    # Both are views of the pipeline's own arrays, valid until the next call
+    def transform(self, windows):
+        num_windows = len(windows)
+        if num_windows > len(self.features):
+            self._allocate(num_windows)
+        features = self.features[:num_windows]
+        totals = self.totals[:num_windows]
+        bad = self.bad[:num_windows]
+
+        np.greater(np.max(np.abs(windows), axis=(1, 2)), self.bad_amplitude, out=bad)
+        psds, frequencies = multitaper_psd(windows, self.sampling_rate, self.frequency_range[0],
+                                           self.frequency_range[1], bandwidth=self.bandwidth,
+                                           adaptive=self.adaptive, normalization='full')
+        # Power relative to the total, normalized by the training spread
+        np.dot(psds, self.total_weights, out=totals)
+        psds /= totals[..., np.newaxis]
+        np.multiply(psds.transpose(0, 2, 1), self.scale, out=features[:, 0])
+        return features, bad
+
+    # Features of the newest window of a (board rows x samples) block, filtered from rest
+    # The block needs settle_samples + window_samples samples
+    def transform_recent(self, data):
+        data = data[self.channels, -(self.settle_samples + self.window_samples):]
+        data = data - np.mean(data, axis=1, keepdims=True)
+        data = apply_filters(data, self.sos_list)
+        return self.transform(data[np.newaxis, :, self.settle_samples:])
+
+    # Only a pipeline with training statistics can be saved, it is meant to go next to a model
+    def save(self, path):
+        if self.train_std is None:
+            raise ValueError('A feature pipeline without training statistics can\'t be saved')
+        with open(path, 'wb') as f:
+            np.savez(f, channels=self.channels,
+                     filter_types=np.array([spec[0] for spec in self.filters]),
+                     filter_bands=np.array([spec[1:] for spec in self.filters], dtype=np.float64),
+                     window_seconds=self.window_seconds, settle_seconds=self.settle_seconds,
+                     frequency_range=np.array(self.frequency_range), half_bandwidth=self.half_bandwidth,
+                     adaptive=self.adaptive, bad_amplitude=self.bad_amplitude, train_std=self.train_std)
+
+
+def load_pipeline(path):
+    with np.load(path, allow_pickle=False) as saved:
+        filters = [(filter_type, low, high, int(order))
+                   for filter_type, (low, high, order) in zip(saved['filter_types'], saved['filter_bands'])]
+        return HandFeaturePipeline(saved['channels'], filters, float(saved['window_seconds']),
+                                   float(saved['settle_seconds']), tuple(saved['frequency_range']),
+                                   float(saved['half_bandwidth']), bool(saved['adaptive']),
+                                   float(saved['bad_amplitude']), saved['train_std'])
+
+
+# Feature pipeline file that belongs to a model file
+def features_path(model_path):
+    return os.path.splitext(model_path)[0] + FEATURES_EXTENSION
+
+
+# Pipeline saved next to the model, or the one rbmeotmd1 was trained with if there is none
+def pipeline_for_model(model_path):
+    path = features_path(model_path)
+    if os.path.exists(path):
+        return load_pipeline(path)
+    return HandFeaturePipeline()
@@ -0,0 +1,301 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from handFeatures import HandFeaturePipeline, features_path, pipeline_for_model
+from inferenceBackend import export_numpy, load_backend
+from movementDetector import StreamingWindows
+from recordingStore import RECORDING_EXTENSION, import_csv, load_recording
+
+# Train and evaluate the finger movement model offline, with the same features as live detection
+# python handModelTraining.py sessions.json --output rbmeotmd2.keras
+# python handModelTraining.py sessions.json --model rbmeotmd1.keras
+# sessions.json lists recordings (.brec, or CSV in the state_raw_data layout) and their labels:
+#   {"sessions": [
+#       {"recording": "rest.brec", "label": 0},
+#       {"recording": "lifts.brec", "events": [3.2, 7.9, 12.4]},
+#       {"recording": "lifts2.csv", "sampling_rate": 250, "events": [2.5, 6.1], "split": "test"}
+#   ]}
+# A session is labelled as a whole, or by the times in seconds of each finger lift, in which
+# case a window is a movement window if a lift falls inside it. Relative paths are relative to
+# the sessions file. Sessions with "split": "test" are held out for evaluation.
+# Windows are cut exactly like HandPredictionWidget does live. Their features are extracted
+# per session in a process pool and cached unnormalized under --cache, keyed by the feature
+# settings, hop, labels and recording, so a model or normalization change reuses them
+
+HOP_SECONDS = 0.05
+CACHE_DIR = 'feature_cache'
+# Windows featurized per transform call
+FEATURE_BATCH = 256
+# Model calls timed for the latency report
+LATENCY_CALLS = 200
+MOVEMENT_THRESHOLD = 0.5
+
+
+def read_sessions(path):
+    with open(path) as f:
+        sessions = json.load(f)['sessions']
+    base = os.path.dirname(os.path.abspath(path))
+    for session in sessions:
+        session['recording'] = os.path.join(base, session['recording'])
+    return sessions
+
+
+# Board-shaped rows of a recording, so the pipeline's channel indices select the same electrodes
+# as live. Recordings without a channel list (CSV) hold the EXG rows starting at board row 1
+def recording_rows(session):
+    path = session['recording']
+    if path.endswith(RECORDING_EXTENSION):
+        data, header = load_recording(path, mmap=False)
+        sampling_rate = header['sampling_rate']
+        channels = header.get('channels')
+    else:
+        data = import_csv(path)
+        sampling_rate = session.get('sampling_rate', 250)
+        channels = None
+    if channels is None:
+        channels = list(range(1, data.shape[0] + 1))
+    rows = np.zeros((max(channels) + 1, data.shape[1]))
+    rows[channels] = data
+    return rows, sampling_rate
+
+
+# Key of a session's cached features, changes with anything that changes them
+def cache_key(session, config, hop_seconds):
+    stat = os.stat(session['recording'])
+    description = {
+        'config': config,
+        'hop_seconds': hop_seconds,
+        'recording': os.path.abspath(session['recording']),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sampling_rate': session.get('sampling_rate'),
+        'label': session.get('label'),
+        'events': session.get('events'),
+    }
+    return hashlib.sha1(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# Unnormalized features, labels and muscle interference mask of every window of a session,
+# and its sampling rate
+# Runs in a worker process, results are cached on disk
+def session_features(session, config, hop_seconds, cache_dir):
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, cache_key(session, config, hop_seconds) + '.npz')
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as cached:
+                return cached['features'], cached['labels'], cached['bad'], int(cached['sampling_rate'])
+
+    rows, sampling_rate = recording_rows(session)
+    # Normalization is applied by the caller
+    pipeline = HandFeaturePipeline(train_std=None, **config).configure(sampling_rate)
+
+    # The live windowing, with room for every window of the recording
+    hop_samples = max(1, int(round(hop_seconds * sampling_rate)))
+    num_windows = max(0, (rows.shape[1] - pipeline.settle_samples - pipeline.window_samples) // hop_samples + 1)
+    windows = StreamingWindows(pipeline.channels, pipeline.sos_list, pipeline.window_samples, hop_samples,
+                               max_batch=max(1, num_windows), settle_samples=pipeline.settle_samples)
+    windows.write(rows)
+    windows = windows.windows()
+
+    features = np.empty((len(windows),) + pipeline.features.shape[1:])
+    bad = np.empty(len(windows), dtype=bool)
+    for start in range(0, len(windows), FEATURE_BATCH):
+        batch_features, batch_bad = pipeline.transform(windows[start:start + FEATURE_BATCH])
+        features[start:start + len(batch_features)] = batch_features
+        bad[start:start + len(batch_bad)] = batch_bad
+
+    # Window k covers recording samples [end - window, end)
+    ends = pipeline.settle_samples + pipeline.window_samples + hop_samples * np.arange(len(windows))
+    if 'events' in session:
+        events = np.sort(np.asarray(session['events'], dtype=np.float64) * sampling_rate)
+        labels = (np.searchsorted(events, ends) - np.searchsorted(events, ends - pipeline.window_samples)) > 0
+    else:
+        labels = np.full(len(windows), bool(session['label']))
+    labels = labels.astype(np.float64)
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_path = cache_path + '.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, features=features, labels=labels, bad=bad, sampling_rate=sampling_rate)
+        os.replace(temporary_path, cache_path)
+    return features, labels, bad, sampling_rate
+
+
+# Features of every session, extracted in parallel, in session order
+def extract_sessions(sessions, config, hop_seconds, cache_dir, jobs=None):
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(session_features, session, config, hop_seconds, cache_dir)
+                   for session in sessions]
+        return [future.result() for future in futures]
+
+
+def concatenate(results):
+    features = np.concatenate([result[0] for result in results])
+    labels = np.concatenate([result[1] for result in results])
+    bad = np.concatenate([result[2] for result in results])
+    return features, labels, bad
+
+
+# Small dense network over the (1 x bins x channels) features
+def build_model(input_shape):
+    import keras
+    model = keras.Sequential([
+        keras.Input(shape=input_shape),
+        keras.layers.Flatten(),
+        keras.layers.Dense(64, activation='relu'),
+        keras.layers.Dropout(0.3),
+        keras.layers.Dense(1, activation='sigmoid'),
+    ])
+    model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+    return model
+
+
+# Fit a new model on the clean training windows, with normalization statistics from the same windows
+# Returns the model and the pipeline that belongs to it
+def train(features, labels, bad, config, epochs):
+    features, labels = features[~bad], labels[~bad]
+    train_std = np.std(features[:, 0], axis=0)
+    train_std[train_std == 0] = 1.0
+    pipeline = HandFeaturePipeline(train_std=train_std, **config)
+
+    # Balance movement and rest windows
+    num_positive = max(1, int(np.sum(labels)))
+    num_negative = max(1, len(labels) - num_positive)
+    class_weight = {0: len(labels) / (2.0 * num_negative), 1: len(labels) / (2.0 * num_positive)}
+
+    model = build_model(features.shape[1:])
+    model.fit(features * pipeline.scale, labels, epochs=epochs, batch_size=64, shuffle=True,
+              class_weight=class_weight, verbose=2)
+    return model, pipeline
+
+
+# Accuracy of a model on windows, using the live decision (movement and not interference)
+def evaluate(backend, pipeline, features, labels, bad):
+    predictions = np.ravel(backend.predict(features * pipeline.scale))
+    moved = (predictions > MOVEMENT_THRESHOLD) & ~bad
+    truth = labels > 0.5
+    return {
+        'windows': int(len(labels)),
+        'bad_windows': int(np.sum(bad)),
+        'accuracy': float(np.mean(moved == truth)) if len(labels) else float('nan'),
+        'true_positive_rate': float(np.mean(moved[truth])) if np.any(truth) else float('nan'),
+        'false_positive_rate': float(np.mean(moved[~truth])) if np.any(~truth) else float('nan'),
+    }
+
+
+# Per-window latency of the features and of the model, one window at a time like the live page
+def measure_latency(backend, pipeline, sampling_rate, features):
+    pipeline.configure(sampling_rate)
+    window = np.random.default_rng(0).standard_normal((1, len(pipeline.channels), pipeline.window_samples))
+    sample = features[:1] * pipeline.scale
+    pipeline.transform(window)
+    backend.predict(sample)
+
+    feature_times = []
+    model_times = []
+    for i in range(LATENCY_CALLS):
+        start = time.perf_counter()
+        pipeline.transform(window)
+        middle = time.perf_counter()
+        backend.predict(sample)
+        feature_times.append(middle - start)
+        model_times.append(time.perf_counter() - middle)
+    return {
+        'features_ms': _percentiles(feature_times),
+        'model_ms': _percentiles(model_times),
+    }
+
+
+def _percentiles(times):
+    times_ms = np.array(times) * 1000.0
+    return {
+        'mean': float(np.mean(times_ms)),
+        'p50': float(np.percentile(times_ms, 50)),
+        'p99': float(np.percentile(times_ms, 99)),
+    }
+
+
+def print_report(report):
+    for split in ('train', 'test'):
+        if split in report:
+            result = report[split]
+            print('{:<6} {:>7} windows ({:>5} bad)  accuracy {:.3f}  TPR {:.3f}  FPR {:.3f}'.format(
+                split, result['windows'], result['bad_windows'], result['accuracy'],
+                result['true_positive_rate'], result['false_positive_rate']))
+    latency = report['latency']
+    print('latency per window: features p50 {:.3f} ms p99 {:.3f} ms, model p50 {:.3f} ms p99 {:.3f} ms'.format(
+        latency['features_ms']['p50'], latency['features_ms']['p99'],
+        latency['model_ms']['p50'], latency['model_ms']['p99']))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Train or evaluate the finger movement model on recorded sessions')
+    parser.add_argument('sessions', type=str, help='JSON list of recordings and labels')
+    parser.add_argument('--model', type=str, default='', help='evaluate this model instead of training one')
+    parser.add_argument('--output', type=str, default='hand_model.keras', help='where to save a trained model')
+    parser.add_argument('--export-numpy', action='store_true', help='also save the trained model for the NumPy backend')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--hop', type=float, default=HOP_SECONDS, help='seconds between windows')
+    parser.add_argument('--fast', action='store_true', help='fast multitaper weights instead of adaptive ones')
+    parser.add_argument('--jobs', type=int, default=None, help='feature extraction processes')
+    parser.add_argument('--cache', type=str, default=CACHE_DIR, help='feature cache directory, empty to disable')
+    parser.add_argument('--report', type=str, default='', help='write the report as JSON')
+    args = parser.parse_args(argv)
+
+    sessions = read_sessions(args.sessions)
+    if not args.model and all(session.get('split') == 'test' for session in sessions):
+        raise ValueError('No training sessions in ' + args.sessions + ', every session has "split": "test"')
+    if args.model:
+        pipeline = pipeline_for_model(args.model)
+    else:
+        pipeline = HandFeaturePipeline()
+        if args.fast:
+            pipeline.adaptive = False
+    config = pipeline.config()
+
+    started = time.perf_counter()
+    results = extract_sessions(sessions, config, args.hop, args.cache, args.jobs)
+    print('features of {} sessions in {:.1f} s'.format(len(sessions), time.perf_counter() - started))
+
+    splits = {'train': [], 'test': []}
+    for session, result in zip(sessions, results):
+        splits['test' if session.get('split') == 'test' else 'train'].append(result)
+
+    # Recordings shorter than settle plus window have no windows at all
+    with_windows = [result for result in results if len(result[1]) > 0]
+    if not with_windows:
+        raise ValueError('No session is long enough for a single window')
+
+    if args.model:
+        backend = load_backend(args.model)
+    else:
+        train_bad = concatenate(splits['train'])[2]
+        if np.all(train_bad):
+            raise ValueError('The training sessions have no windows without muscle interference')
+        model, pipeline = train(*concatenate(splits['train']), config, args.epochs)
+        model.save(args.output)
+        pipeline.save(features_path(args.output))
+        if args.export_numpy:
+            export_numpy(model, os.path.splitext(args.output)[0] + '.npz')
+        backend = load_backend(args.output)
+
+    report = {}
+    for split, split_results in splits.items():
+        if any(len(result[1]) > 0 for result in split_results):
+            report[split] = evaluate(backend, pipeline, *concatenate(split_results))
+    report['latency'] = measure_latency(backend, pipeline, with_windows[0][3], with_windows[0][0])
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
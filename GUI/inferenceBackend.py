@@ -0,0 +1,128 @@
+import os
+import sys
+import argparse
+import numpy as np
+
+# Finger movement model next to this file, unless the environment variable says otherwise
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rbmeotmd1.keras')
+MODEL_PATH_ENV = 'BRAINBOI_HAND_MODEL'
+
+
+def softmax(x):
+    x = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return x / np.sum(x, axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': softmax,
+}
+
+# Layers that don't change the numbers at inference time
+PASSTHROUGH_LAYERS = ('InputLayer', 'Flatten', 'Dropout')
+
+
+# Path from the environment variable, else the default
+def model_path():
+    return os.environ.get(MODEL_PATH_ENV) or DEFAULT_MODEL_PATH
+
+
+# Keras model called directly instead of through predict(), which sets up batching
+# machinery on every call. With the TensorFlow backend the call is compiled once
+class KerasBackend:
+    def __init__(self, path):
+        import keras
+        self.model = keras.models.load_model(path)
+        self.call = lambda x: self.model(x, training=False)
+        if keras.backend.backend() == 'tensorflow':
+            import tensorflow as tf
+            self.call = tf.function(self.call, reduce_retracing=True)
+
+    def predict(self, x):
+        return np.asarray(self.call(np.asarray(x, dtype=np.float32)))
+
+
+# Small dense network evaluated with NumPy from exported weights (see export_numpy)
+class NumpyBackend:
+    def __init__(self, path):
+        with np.load(path) as weights:
+            num_layers = int(weights['num_layers'])
+            self.layers = [(weights['kernel_' + str(i)], weights['bias_' + str(i)],
+                            ACTIVATIONS[str(weights['activation_' + str(i)])])
+                           for i in range(num_layers)]
+
+    def predict(self, x):
+        x = np.asarray(x, dtype=np.float64).reshape(len(x), -1)
+        for kernel, bias, activation in self.layers:
+            x = activation(x @ kernel + bias)
+        return x
+
+
+# Exported ONNX model run with onnxruntime, if it is installed
+class OnnxBackend:
+    def __init__(self, path):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError('onnxruntime is needed to run ' + path)
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, x):
+        return self.session.run(None, {self.input_name: np.asarray(x, dtype=np.float32)})[0]
+
+
+# Backend for a model file, picked by its extension
+def load_backend(path):
+    if path.endswith('.npz'):
+        return NumpyBackend(path)
+    if path.endswith('.onnx'):
+        return OnnxBackend(path)
+    return KerasBackend(path)
+
+
+# Save the dense layers of a Keras model as plain NumPy weights for NumpyBackend
+# NumpyBackend flattens its input first, so every Dense layer has to see a flat vector:
+# a Dense layer before Flatten, on a multi-dimensional input, is rejected
+def export_numpy(model, path):
+    weights = {}
+    num_layers = 0
+    input_size = int(np.prod(model.input_shape[1:]))
+    for layer in model.layers:
+        layer_type = type(layer).__name__
+        if layer_type in PASSTHROUGH_LAYERS:
+            continue
+        if layer_type != 'Dense':
+            raise ValueError('Only dense networks can be exported, found ' + layer_type)
+        activation = layer.get_config()['activation']
+        if activation not in ACTIVATIONS:
+            raise ValueError('Unsupported activation ' + str(activation))
+        kernel, bias = layer.get_weights()
+        if kernel.shape[0] != input_size:
+            raise ValueError('Dense layer ' + layer.name + ' takes ' + str(kernel.shape[0]) + ' inputs, '
+                             + 'the flattened input has ' + str(input_size) + ', add a Flatten before it')
+        input_size = kernel.shape[1]
+        weights['kernel_' + str(num_layers)] = kernel
+        weights['bias_' + str(num_layers)] = bias
+        weights['activation_' + str(num_layers)] = np.array(activation)
+        num_layers += 1
+    np.savez(path, num_layers=num_layers, **weights)
+
+
+# Export a Keras model for the NumPy backend
+# python inferenceBackend.py rbmeotmd1.keras rbmeotmd1.npz
+def main(argv):
+    parser = argparse.ArgumentParser(description='Export a dense Keras model as NumPy weights')
+    parser.add_argument('source', type=str)
+    parser.add_argument('destination', type=str)
+    args = parser.parse_args(argv)
+
+    import keras
+    export_numpy(keras.models.load_model(args.source), args.destination)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,70 @@
+import numpy as np
+from ringBuffer import RingBuffer
+from signalFilters import StreamingFilterChain
+
+# Most windows evaluated in one call, older pending windows are dropped when further behind
+MAX_BATCH = 8
+
+
+# Overlapping analysis windows from a live stream, one every hop_samples samples
+# New samples of the selected channels are filtered once with a stateful filter chain
+# and kept in a ring, so consecutive windows share their filtered samples and nothing is
+# thrown away to let the filters settle except settle_samples at the very start.
+# windows() returns every window that completed since the last call as one
+# (windows x channels x window_samples) array, so callers can evaluate them in a single
+# batch; when more than max_batch are pending only the newest max_batch are returned
+class StreamingWindows:
+    def __init__(self, channels, sos_list, window_samples, hop_samples, max_batch=MAX_BATCH,
+                 settle_samples=0):
+        self.channels = list(channels)
+        self.window_samples = int(window_samples)
+        self.hop_samples = max(1, int(hop_samples))
+        self.max_batch = max(1, int(max_batch))
+        self.filter_chain = StreamingFilterChain(sos_list, len(self.channels))
+        self.samples = RingBuffer(len(self.channels), self.window_samples + self.max_batch * self.hop_samples)
+        self.settle_samples = int(settle_samples)
+        self.reset()
+
+    def reset(self):
+        self.filter_chain.reset()
+        self.samples.clear()
+        self.settle_remaining = self.settle_samples
+        # Filtered sample count at which the next window ends
+        self.next_end = self.window_samples
+        self.dropped_windows = 0
+
+    # Filter a (board rows x n) block of new samples into the ring
+    def write(self, block):
+        if block.shape[1] == 0:
+            return
+        filtered = self.filter_chain.process(block[self.channels])
+        if self.settle_remaining > 0:
+            skipped = min(self.settle_remaining, filtered.shape[1])
+            filtered = filtered[:, skipped:]
+            self.settle_remaining -= skipped
+        self.samples.write(filtered)
+
+    # Number of windows that completed since the last call to windows()
+    def num_pending(self):
+        total = self.samples.total_written
+        if total < self.next_end:
+            return 0
+        return (total - self.next_end) // self.hop_samples + 1
+
+    # (windows x channels x window_samples) array of the completed windows, oldest first
+    # A read-only view into the ring, only valid until the next write
+    def windows(self):
+        num_windows = self.num_pending()
+        if num_windows == 0:
+            return np.zeros((0, len(self.channels), self.window_samples))
+        if num_windows > self.max_batch:
+            skipped = num_windows - self.max_batch
+            self.dropped_windows += skipped
+            self.next_end += skipped * self.hop_samples
+            num_windows = self.max_batch
+        # From the start of the first window up to the newest sample
+        span = self.samples.latest(self.samples.total_written - (self.next_end - self.window_samples))
+        strided = np.lib.stride_tricks.sliding_window_view(span, self.window_samples, axis=1)
+        windows = strided[:, :num_windows * self.hop_samples:self.hop_samples].transpose(1, 0, 2)
+        self.next_end += num_windows * self.hop_samples
+        return windows
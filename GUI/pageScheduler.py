@@ -0,0 +1,113 @@
+import time
+from PySide6.QtCore import Qt, QTimer
+
+# What to do with ticks that come due while a task is still catching up
+# COALESCE: run once for all the ticks that were missed
+# SKIP: also drop ticks that arrive within one interval of the end of an overrunning run
+COALESCE = 'coalesce'
+SKIP = 'skip'
+
+
+# One periodic callback of a page with its own timer
+class PageTask:
+    def __init__(self, name, callback, interval_ms, overrun=COALESCE, profiler=None):
+        self.name = name
+        self.callback = callback
+        self.interval_ms = interval_ms
+        self.overrun = overrun
+        self.profiler = profiler
+        self.enabled = False
+        self.busy = False
+        self.skip_until = 0.0
+        self.skipped_ticks = 0
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.timeout.connect(self.run)
+
+    def set_interval(self, interval_ms):
+        self.interval_ms = interval_ms
+        self.timer.setInterval(interval_ms)
+
+    def resume(self):
+        if self.enabled and not self.timer.isActive():
+            self.timer.start(self.interval_ms)
+
+    def pause(self):
+        self.timer.stop()
+
+    def run(self):
+        now = time.perf_counter()
+        # A callback that processes events can be re-entered by its own timer
+        if self.busy or now < self.skip_until:
+            self.skipped_ticks += 1
+            if self.profiler is not None:
+                self.profiler.set_counter(self.name + '.skipped', self.skipped_ticks)
+            return
+        self.busy = True
+        try:
+            if self.profiler is not None:
+                self.profiler.tick(self.name, self.interval_ms)
+                with self.profiler.stage(self.name):
+                    self.callback()
+            else:
+                self.callback()
+        finally:
+            self.busy = False
+        end = time.perf_counter()
+        if self.overrun == SKIP and (end - now) * 1000.0 > self.interval_ms:
+            self.skip_until = end + self.interval_ms / 1000.0
+
+
+# Runs the periodic work of every page, replacing the one timer all pages shared
+# Each page registers its tasks (e.g. a compute and a render cadence) once; only
+# the tasks of the visible page run, the others are paused until it is shown again
+class PageScheduler:
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.tasks = {}
+        self.active_page = None
+
+    # Add a task to a page, or update it if the page already registered one with this name
+    def register(self, page, name, callback, interval_ms, overrun=COALESCE):
+        page_tasks = self.tasks.setdefault(page, {})
+        task = page_tasks.get(name)
+        if task is None:
+            task = page_tasks[name] = PageTask(name, callback, interval_ms, overrun, self.profiler)
+        else:
+            task.callback = callback
+            task.overrun = overrun
+            task.set_interval(interval_ms)
+        return task
+
+    def task(self, page, name):
+        return self.tasks[page][name]
+
+    # Let a task run whenever its page is visible
+    def start(self, page, name):
+        task = self.task(page, name)
+        task.enabled = True
+        if page is self.active_page:
+            task.resume()
+
+    def stop(self, page, name):
+        task = self.task(page, name)
+        task.enabled = False
+        task.pause()
+
+    def set_interval(self, page, name, interval_ms):
+        self.task(page, name).set_interval(interval_ms)
+
+    # Call when the visible page changes
+    def activate(self, page):
+        self.active_page = page
+        for other_page, page_tasks in self.tasks.items():
+            for task in page_tasks.values():
+                if other_page is page:
+                    task.resume()
+                else:
+                    task.pause()
+
+    def stop_all(self):
+        for page_tasks in self.tasks.values():
+            for task in page_tasks.values():
+                task.pause()
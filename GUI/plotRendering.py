@@ -0,0 +1,94 @@
+import numpy as np
+
+# Number of min/max bins a scrolling or sweeping window is kept in, whatever its length,
+# until the plots are laid out and it can be one bin per pixel column
+SWEEP_BINS = 1000
+# Bins left blank ahead of the write position in sweep mode
+SWEEP_GAP_BINS = 10
+
+
+# Draws the min/max bins of a SweepBuffer view, one row per curve
+# The plots clip to their view and use pyqtgraph's peak downsampling when zoomed out,
+# and the curves are handed NumPy arrays directly
+class DecimatedCurves:
+    def __init__(self, plots, curves):
+        self.plots = plots
+        self.curves = curves
+        for plot in self.plots:
+            plot.setClipToView(True)
+            plot.setDownsampling(auto=True, mode='peak')
+
+    # Number of horizontal pixels of the narrowest plot, 0 before the plots are shown
+    def pixel_width(self):
+        return int(min(plot.getViewBox().width() for plot in self.plots))
+
+    # Draw a (x, channels x points) view of a SweepBuffer
+    # Points that are NaN (not yet recorded or the sweep gap) are left undrawn
+    def set_xy(self, x, y):
+        for count, curve in enumerate(self.curves):
+            curve.setData(x, y[count], connect='finite')
+
+
+# Preallocated min/max bins of the newest window_samples samples of every channel
+# write() only touches the bins of the new samples, and both views are built in
+# buffers allocated once, so the cost of a frame doesn't depend on the window length
+# Sweep view: bins stay in place and a gap sweeps across them like an ECG monitor
+# Scroll view: the oldest bin is on the left and the newest on the right
+class SweepBuffer:
+    def __init__(self, num_channels, window_samples, sampling_rate, num_bins=SWEEP_BINS):
+        self.window_samples = int(window_samples)
+        self.num_bins = max(1, min(num_bins, self.window_samples))
+        self.bins = np.full((num_channels, self.num_bins, 2), np.nan)
+        self.view = np.empty_like(self.bins)
+        self.order = np.empty(self.num_bins, dtype=np.intp)
+        self.bin_numbers = np.arange(self.num_bins)
+        self.gap = np.arange(1, min(SWEEP_GAP_BINS, self.num_bins - 1) + 1)
+        self.gap_index = np.empty_like(self.gap)
+        # Both points of a bin sit at its start time, in seconds
+        bin_seconds = self.window_samples / self.num_bins / sampling_rate
+        self.x = np.repeat(self.bin_numbers * bin_seconds, 2)
+        self.position = 0
+
+    # Bin that the sample with the given running number falls in
+    def bin_of(self, positions):
+        return (positions % self.window_samples) * self.num_bins // self.window_samples
+
+    # Add a (channels x samples) block of new samples
+    def write(self, block):
+        num_new = block.shape[1]
+        if num_new == 0:
+            return
+        continues = self.position > 0
+        if num_new > self.window_samples:
+            self.position += num_new - self.window_samples
+            block = block[:, -self.window_samples:]
+            num_new = self.window_samples
+            continues = False
+        bins = self.bin_of(np.arange(self.position, self.position + num_new))
+        starts = np.flatnonzero(np.diff(bins, prepend=-1))
+        mins = np.minimum.reduceat(block, starts, axis=1)
+        maxs = np.maximum.reduceat(block, starts, axis=1)
+        # The first bin may already hold samples from the previous block, every other bin starts over
+        if continues and self.bin_of(self.position - 1) == bins[0]:
+            mins[:, 0] = np.fmin(mins[:, 0], self.bins[:, bins[0], 0])
+            maxs[:, 0] = np.fmax(maxs[:, 0], self.bins[:, bins[0], 1])
+        self.bins[:, bins[starts], 0] = mins
+        self.bins[:, bins[starts], 1] = maxs
+        self.position += num_new
+
+    # (x, y) with the bins in place and a blank gap after the newest one
+    def sweep_view(self):
+        np.copyto(self.view, self.bins)
+        newest = self.bin_of(self.position - 1)
+        np.add(self.gap, newest, out=self.gap_index)
+        np.remainder(self.gap_index, self.num_bins, out=self.gap_index)
+        self.view[:, self.gap_index] = np.nan
+        return self.x, self.view.reshape(self.view.shape[0], -1)
+
+    # (x, y) with the bins rotated so the newest is on the right
+    def scroll_view(self):
+        oldest = self.bin_of(self.position - 1) + 1
+        np.add(self.bin_numbers, oldest, out=self.order)
+        np.remainder(self.order, self.num_bins, out=self.order)
+        np.take(self.bins, self.order, axis=1, out=self.view)
+        return self.x, self.view.reshape(self.view.shape[0], -1)
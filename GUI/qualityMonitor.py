@@ -0,0 +1,135 @@
+import numpy as np
+from PySide6.QtCore import QObject, QThread, Signal, Slot
+from signalQuality import full_scale_uv, quality_flags, signal_quality
+
+# Statistics are computed once per hop and combined over the last WINDOW_HOPS hops
+HOP_SECONDS = 0.5
+WINDOW_HOPS = 4
+# Mains frequencies whose amplitude is tracked, and the RMS amplitude in µV that gives a warning
+LINE_FREQUENCIES = (50.0, 60.0)
+LINE_NOISE_WARN_UV = 20.0
+# Package numbers count modulo this, a jump of more than one means samples were lost
+PACKAGE_NUM_MODULO = 256
+# Per channel status codes
+GOOD = 0
+WARN = 1
+BAD = 2
+
+
+# Keeps signal quality metrics of every channel up to date from the shared acquisition stream
+# Each sample is looked at once: new samples are cut into hops, every hop is reduced to a
+# few numbers per channel in one vectorized signal_quality() pass, and the window metrics
+# are combined from a small ring of those and checked with quality_flags(). statusChanged publishes a dict with the same peak / rms /
+# flat_percent / railed_percent arrays as signalQuality.signal_quality, plus variance,
+# line_noise_uv (channels x LINE_FREQUENCIES), dropped_packets and a status code per channel.
+# Runs on its own thread, the GUI thread only receives statusChanged and reads `quality`,
+# which is replaced with a new dict once it is complete
+class SignalQualityMonitor(QObject):
+    statusChanged = Signal(object)
+
+    def __init__(self, acquisition, channels, package_num_channel=None, profiler=None,
+                 hop_seconds=HOP_SECONDS, window_hops=WINDOW_HOPS):
+        super().__init__()
+        self.acquisition = acquisition
+        self.channels = list(channels)
+        self.package_num_channel = package_num_channel
+        self.profiler = profiler
+        self.full_scale = full_scale_uv()
+        sampling_rate = acquisition.sampling_rate
+        self.hop_samples = max(2, int(hop_seconds * sampling_rate))
+
+        # Hann windowed projection onto each line frequency, scaled to an RMS amplitude
+        window = np.hanning(self.hop_samples)
+        t = np.arange(self.hop_samples) / sampling_rate
+        self.line_basis = window[:, None] * np.exp(-2j * np.pi * t[:, None] * np.array(LINE_FREQUENCIES))
+        self.line_basis *= np.sqrt(2) / np.sum(window)
+
+        num_channels = len(self.channels)
+        self.peaks = np.zeros((window_hops, num_channels))
+        self.means = np.zeros((window_hops, num_channels))
+        self.variances = np.zeros((window_hops, num_channels))
+        self.flat_percents = np.zeros((window_hops, num_channels))
+        self.line_noise = np.zeros((window_hops, num_channels, len(LINE_FREQUENCIES)))
+        self.num_hops = 0
+        self.last_package_num = None
+        self.dropped_packets = 0
+        self.quality = None
+
+        self.cursor = acquisition.cursor(0, self)
+        self.worker_thread = QThread()
+        self.moveToThread(self.worker_thread)
+        self.acquisition.samplesReady.connect(self.collect)
+        self.worker_thread.start()
+
+    def stop(self):
+        self.acquisition.samplesReady.disconnect(self.collect)
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.acquisition.release(self)
+
+    # Process every complete hop that arrived since the last call
+    # Queued to the monitor's thread whenever the acquisition thread has new samples
+    @Slot(int)
+    def collect(self, num_new_samples=0):
+        new_data, total = self.acquisition.get_data_since(self.cursor, self)
+        num_hops = new_data.shape[1] // self.hop_samples
+        if num_hops == 0:
+            return
+        if self.profiler is not None:
+            with self.profiler.stage('quality.collect'):
+                self._process(new_data[:, :num_hops * self.hop_samples], num_hops)
+        else:
+            self._process(new_data[:, :num_hops * self.hop_samples], num_hops)
+        self.cursor = total - (new_data.shape[1] - num_hops * self.hop_samples)
+        self.statusChanged.emit(self.quality)
+
+    def _process(self, data, num_hops):
+        if self.package_num_channel is not None:
+            self._count_dropped_packets(data[self.package_num_channel])
+
+        # Only the newest hops that fit in the ring matter
+        keep = min(num_hops, len(self.peaks))
+        hops = data[self.channels, (num_hops - keep) * self.hop_samples:]
+        hops = hops.reshape(len(self.channels), keep, self.hop_samples)
+        hop_quality = signal_quality(hops, self.full_scale)
+        means = np.mean(hops, axis=2)
+        centered = hops - means[..., np.newaxis]
+        slots = (self.num_hops + np.arange(keep)) % len(self.peaks)
+        self.means[slots] = means.T
+        self.variances[slots] = (hop_quality['rms'] ** 2).T
+        self.peaks[slots] = hop_quality['peak'].T
+        self.flat_percents[slots] = hop_quality['flat_percent'].T
+        self.line_noise[slots] = np.abs(centered @ self.line_basis).transpose(1, 0, 2)
+        self.num_hops += keep
+        self.quality = self._combine()
+
+    def _count_dropped_packets(self, package_nums):
+        if self.last_package_num is not None:
+            package_nums = np.concatenate(([self.last_package_num], package_nums))
+        steps = np.diff(package_nums) % PACKAGE_NUM_MODULO
+        self.dropped_packets += int(np.sum(np.maximum(steps - 1, 0)))
+        self.last_package_num = package_nums[-1]
+
+    # Window metrics from the filled part of the ring, hops are all the same length
+    def _combine(self):
+        filled = min(self.num_hops, len(self.peaks))
+        peak = np.max(self.peaks[:filled], axis=0)
+        variance = np.mean(self.variances[:filled], axis=0) + np.var(self.means[:filled], axis=0)
+        flat_percent = np.mean(self.flat_percents[:filled], axis=0)
+        line_noise = np.sqrt(np.mean(self.line_noise[:filled] ** 2, axis=0))
+        quality = {
+            'peak': peak,
+            'rms': np.sqrt(variance),
+            'variance': variance,
+            'flat_percent': flat_percent,
+            'railed_percent': 100.0 * peak / self.full_scale,
+            'line_noise_uv': line_noise,
+            'dropped_packets': self.dropped_packets,
+        }
+
+        railed, railed_warn, flat = quality_flags(quality)
+        status = np.full(len(self.channels), GOOD, dtype=np.int8)
+        status[railed_warn | np.any(line_noise > LINE_NOISE_WARN_UV, axis=1)] = WARN
+        status[railed | flat] = BAD
+        quality['status'] = status
+        return quality
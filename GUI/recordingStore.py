@@ -0,0 +1,97 @@
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+# Binary recording layout:
+#   8 byte magic, 4 byte little-endian header length, JSON header padded so the
+#   samples start on a 64 byte boundary, then the raw (channels x samples) samples
+MAGIC = b'BREC0001'
+ALIGNMENT = 64
+RECORDING_EXTENSION = '.brec'
+
+
+# Write a (channels x samples) recording and its metadata
+# channels are the board rows the data came from, times are unix timestamps
+def save_recording(path, data, sampling_rate, board_id=None, channels=None,
+                   start_time=None, end_time=None, dtype=np.float64):
+    data = np.ascontiguousarray(data, dtype=dtype)
+    header = {
+        'board_id': None if board_id is None else int(board_id),
+        'sampling_rate': sampling_rate,
+        'channels': None if channels is None else [int(channel) for channel in channels],
+        'start_time': start_time,
+        'end_time': end_time,
+        'dtype': data.dtype.str,
+        'shape': list(data.shape),
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = len(MAGIC) + 4 + len(header_bytes)
+    header_bytes += b' ' * (-data_offset % ALIGNMENT)
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(4, 'little'))
+        f.write(header_bytes)
+        f.write(data.tobytes())
+
+
+# Read only the metadata of a recording, plus the offset of its samples
+def read_header(path):
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a recording file')
+        header_length = int.from_bytes(f.read(4), 'little')
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    return header, len(MAGIC) + 4 + header_length
+
+
+# Returns (data, header); data is memory-mapped read-only unless mmap is False
+def load_recording(path, mmap=True):
+    header, data_offset = read_header(path)
+    dtype = np.dtype(header['dtype'])
+    shape = tuple(header['shape'])
+    if mmap:
+        data = np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=shape)
+    else:
+        with open(path, 'rb') as f:
+            f.seek(data_offset)
+            data = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return data, header
+
+
+# Read a recording from the old to_csv layout (index column, one column per channel)
+def import_csv(path):
+    return np.ascontiguousarray(pd.read_csv(path, index_col=0).to_numpy().T)
+
+
+# Write a recording in the old to_csv layout, e.g. state_raw_data/a_data.csv
+def export_csv(path, data):
+    pd.DataFrame(np.transpose(data)).to_csv(path)
+
+
+# Convert between the CSV and binary formats
+# python recordingStore.py state_raw_data/a_data.csv state_raw_data/a_data.brec --sampling-rate 250
+def main(argv):
+    parser = argparse.ArgumentParser(description='Convert recordings between CSV and the binary format')
+    parser.add_argument('source', type=str)
+    parser.add_argument('destination', type=str)
+    parser.add_argument('--sampling-rate', type=int, default=250, help='sampling rate of a CSV source')
+    parser.add_argument('--board-id', type=int, default=None, help='board id of a CSV source')
+    args = parser.parse_args(argv)
+
+    if args.source.endswith(RECORDING_EXTENSION):
+        data, header = load_recording(args.source)
+    else:
+        data = import_csv(args.source)
+        header = {'sampling_rate': args.sampling_rate, 'board_id': args.board_id}
+
+    if args.destination.endswith(RECORDING_EXTENSION):
+        save_recording(args.destination, data, header['sampling_rate'], header.get('board_id'),
+                       header.get('channels'), header.get('start_time'), header.get('end_time'))
+    else:
+        export_csv(args.destination, data)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
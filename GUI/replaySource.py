@@ -0,0 +1,92 @@
+import time
+import numpy as np
+from brainflow.board_shim import BoardShim, BoardIds
+from recordingStore import RECORDING_EXTENSION, import_csv, load_recording
+
+# Samples handed out per poll when replaying as fast as possible
+MAX_SPEED_CHUNK = 1000
+
+
+# Stands in for BoardShim and streams a saved recording through the normal acquisition path
+# Accepts recordings in the binary format or the old state_raw_data/*.csv layout
+# speed is a multiple of real time (1 = real time, 4 = four times faster);
+# 0 or None hands out samples as fast as they are polled, see AcquisitionService.start(paced=True)
+class ReplayBoard:
+    def __init__(self, path, speed=1.0, loop=True, board_id=BoardIds.CYTON_BOARD.value):
+        channels = None
+        if path.endswith(RECORDING_EXTENSION):
+            recording, header = load_recording(path)
+            if header.get('board_id') is not None:
+                board_id = header['board_id']
+            channels = header.get('channels')
+        else:
+            recording = import_csv(path)
+
+        self.board_id = int(board_id)
+        self.sampling_rate = BoardShim.get_sampling_rate(self.board_id)
+        if channels is None:
+            channels = BoardShim.get_exg_channels(self.board_id)[:recording.shape[0]]
+        self.package_num_channel = BoardShim.get_package_num_channel(self.board_id)
+        self.timestamp_channel = BoardShim.get_timestamp_channel(self.board_id)
+
+        # Lay the recording out like the board's own data rows
+        self.num_samples = recording.shape[1]
+        self.data = np.zeros((BoardShim.get_num_rows(self.board_id), self.num_samples))
+        self.data[channels] = recording
+
+        self.speed = speed
+        self.loop = loop
+        self.prepared = False
+        self.streaming = False
+        self.num_sent = 0
+        self.start_time = 0.0
+        self.start_timestamp = 0.0
+
+    def get_board_id(self):
+        return self.board_id
+
+    def prepare_session(self):
+        self.prepared = True
+
+    def is_prepared(self):
+        return self.prepared
+
+    def start_stream(self, buffer_size=0, streamer_params=''):
+        self.num_sent = 0
+        self.start_time = time.monotonic()
+        self.start_timestamp = time.time()
+        self.streaming = True
+
+    def stop_stream(self):
+        self.streaming = False
+
+    def release_session(self):
+        self.prepared = False
+
+    # True once a recording that doesn't loop has been sent completely
+    def is_finished(self):
+        return not self.loop and self.num_sent >= self.num_samples
+
+    # Every sample that is due since the last call, like BoardShim.get_board_data
+    def get_board_data(self, num_samples=None):
+        if not self.streaming:
+            return np.zeros((self.data.shape[0], 0))
+        if not self.speed:
+            target = self.num_sent + MAX_SPEED_CHUNK
+        else:
+            target = int((time.monotonic() - self.start_time) * self.speed * self.sampling_rate)
+        if not self.loop:
+            target = min(target, self.num_samples)
+        if num_samples is not None:
+            target = min(target, self.num_sent + num_samples)
+        if target <= self.num_sent:
+            return np.zeros((self.data.shape[0], 0))
+
+        sample_numbers = np.arange(self.num_sent, target)
+        block = self.data[:, sample_numbers % self.num_samples]
+        # Package numbers and timestamps keep counting across loops
+        # Timestamps are in recording time, one sample period apart whatever the replay speed
+        block[self.package_num_channel] = sample_numbers % 256
+        block[self.timestamp_channel] = self.start_timestamp + sample_numbers / self.sampling_rate
+        self.num_sent = target
+        return block
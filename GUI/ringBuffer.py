@@ -0,0 +1,52 @@
+import numpy as np
+
+
+# Preallocated (rows x samples) ring buffer
+# Every sample is written twice, one capacity apart, so the newest n samples are
+# always one contiguous slice and can be handed out as a view without copying
+class RingBuffer:
+    def __init__(self, num_rows, capacity, dtype=np.float64):
+        self.num_rows = num_rows
+        self.capacity = capacity
+        self.data = np.zeros((num_rows, 2 * capacity), dtype=dtype)
+        self.write_pos = 0
+        self.count = 0
+        self.total_written = 0
+
+    # Append a (rows x n) block, overwriting the oldest samples when full
+    def write(self, block):
+        n = block.shape[1]
+        if n == 0:
+            return
+        self.total_written += n
+        if n > self.capacity:
+            block = block[:, -self.capacity:]
+            n = self.capacity
+        start = self.write_pos
+        first = min(n, self.capacity - start)
+        self.data[:, start:start + first] = block[:, :first]
+        self.data[:, start + self.capacity:start + self.capacity + first] = block[:, :first]
+        if first < n:
+            rest = n - first
+            self.data[:, :rest] = block[:, first:]
+            self.data[:, self.capacity:self.capacity + rest] = block[:, first:]
+        self.write_pos = (start + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    # Read-only view of the newest num_samples samples (fewer if not yet available)
+    def latest(self, num_samples):
+        num_samples = min(int(num_samples), self.count)
+        end = self.write_pos + self.capacity
+        view = self.data[:, end - num_samples:end]
+        view.flags.writeable = False
+        return view
+
+    # Read-only view of every sample written after the running total `since`
+    # Samples that were already overwritten are skipped
+    def since(self, since):
+        return self.latest(self.total_written - since)
+
+    def clear(self):
+        self.write_pos = 0
+        self.count = 0
+        self.total_written = 0
@@ -0,0 +1,91 @@
+import numpy as np
+from scipy import signal
+
+
+# Registry of designed Butterworth filters shared by every page
+# Each (sampling rate, type, low, high, order) filter is designed once and the SOS
+# array is reused; hits/misses show whether anything is redesigned in the hot path
+class FilterBank:
+    def __init__(self):
+        self.filters = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, sampling_rate, filter_type, low, high, order):
+        key = (float(sampling_rate), filter_type, float(low), float(high), int(order))
+        sos = self.filters.get(key)
+        if sos is None:
+            self.misses += 1
+            sos = self._design(*key)
+            # Shared between callers, so don't let anyone modify it
+            sos.flags.writeable = False
+            self.filters[key] = sos
+        else:
+            self.hits += 1
+        return sos
+
+    def stats(self):
+        return {'filters': len(self.filters), 'hits': self.hits, 'misses': self.misses}
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    # A band pass reaching Nyquist becomes a high pass, which is what DataFilter ends up doing
+    def _design(self, sampling_rate, filter_type, low, high, order):
+        if filter_type == 'bandpass' and high >= sampling_rate / 2.0:
+            return signal.butter(order, low, btype='highpass', fs=sampling_rate, output='sos')
+        if filter_type == 'highpass':
+            return signal.butter(order, low, btype='highpass', fs=sampling_rate, output='sos')
+        if filter_type == 'lowpass':
+            return signal.butter(order, high, btype='lowpass', fs=sampling_rate, output='sos')
+        return signal.butter(order, [low, high], btype=filter_type, fs=sampling_rate, output='sos')
+
+
+filter_bank = FilterBank()
+
+
+# Butterworth band pass in second-order sections from the shared filter bank
+# Takes the same centre frequency / band width arguments as DataFilter.perform_bandpass
+def design_bandpass(sampling_rate, center_freq, band_width, order):
+    return filter_bank.get(sampling_rate, 'bandpass', center_freq - band_width / 2.0,
+                           center_freq + band_width / 2.0, order)
+
+
+# Butterworth band stop in second-order sections from the shared filter bank
+# Takes the same arguments as DataFilter.perform_bandstop
+def design_bandstop(sampling_rate, center_freq, band_width, order):
+    return filter_bank.get(sampling_rate, 'bandstop', center_freq - band_width / 2.0,
+                           center_freq + band_width / 2.0, order)
+
+
+# Run a cascade of SOS filters over a whole (channels x samples) block in one call
+# Stateless like DataFilter (starts from rest), but returns a new array
+def apply_filters(data, sos_list):
+    if len(sos_list) == 0:
+        return data
+    return signal.sosfilt(np.vstack(sos_list), data, axis=-1)
+
+
+# Cascade of SOS filters applied to a live (channels x samples) stream
+# Keeps the per-channel filter state between calls, so each call only filters the
+# samples that arrived since the last one and there are no edge transients
+class StreamingFilterChain:
+    def __init__(self, sos_list, num_channels):
+        self.sos = np.vstack(sos_list)
+        self.num_channels = num_channels
+        self.zi = None
+
+    # Filter a block of new samples, returns a new (channels x n) array
+    def process(self, block):
+        if block.shape[-1] == 0:
+            return np.zeros((self.num_channels, 0))
+        if self.zi is None:
+            # Start from the steady state for the first sample instead of from rest
+            # so the DC offset of the electrodes doesn't ring through the filters
+            self.zi = signal.sosfilt_zi(self.sos)[:, np.newaxis, :] * block[np.newaxis, :, 0, np.newaxis]
+        filtered, self.zi = signal.sosfilt(self.sos, block, axis=-1, zi=self.zi)
+        return filtered
+
+    def reset(self):
+        self.zi = None
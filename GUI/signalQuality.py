@@ -0,0 +1,49 @@
+import numpy as np
+
+# OpenBCI ADS1299: 4.5 V reference, 24 bit, channel gain 24
+ADC_REFERENCE_V = 4.5
+ADC_BITS = 24
+CHANNEL_GAIN = 24
+# Percentage of the ADC range at which a channel counts as (almost) railed
+RAILED_PERCENT = 90
+RAILED_WARN_PERCENT = 75
+# Percentage of unchanged consecutive samples at which a channel counts as a flat line
+FLAT_LINE_PERCENT = 50
+
+
+# Largest magnitude the ADC can report, in µV
+def full_scale_uv(gain=CHANNEL_GAIN):
+    scalar = ADC_REFERENCE_V / (pow(2, ADC_BITS - 1) - 1) / gain * 1000000.
+    return scalar * pow(2, ADC_BITS - 1)
+
+
+# Quality of every channel of a (channels x samples) window of raw µV data
+# peak and rms are in µV (rms around the channel mean), flat_percent is the share of
+# consecutive samples that are identical and railed_percent the peak as a share of the ADC range.
+# Works along the last axis, so (channels x hops x samples) gives (channels x hops) results
+def signal_quality(data, full_scale=None):
+    if full_scale is None:
+        full_scale = full_scale_uv()
+    if data.shape[-1] == 0:
+        zeros = np.zeros(data.shape[:-1])
+        return {'peak': zeros, 'rms': zeros, 'flat_percent': zeros, 'railed_percent': zeros}
+    peak = np.maximum(np.max(data, axis=-1), -np.min(data, axis=-1))
+    rms = np.std(data, axis=-1)
+    if data.shape[-1] > 1:
+        flat_percent = 100.0 * np.count_nonzero(data[..., 1:] == data[..., :-1], axis=-1) / (data.shape[-1] - 1)
+    else:
+        flat_percent = np.zeros(data.shape[:-1])
+    return {
+        'peak': peak,
+        'rms': rms,
+        'flat_percent': flat_percent,
+        'railed_percent': 100.0 * peak / full_scale,
+    }
+
+
+# Masks of the channels that are railed, almost railed and flat
+def quality_flags(quality):
+    railed = quality['railed_percent'] > RAILED_PERCENT
+    railed_warn = quality['railed_percent'] > RAILED_WARN_PERCENT
+    flat = quality['flat_percent'] > FLAT_LINE_PERCENT
+    return railed, railed_warn, flat
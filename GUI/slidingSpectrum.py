@@ -0,0 +1,130 @@
+import numpy as np
+from ringBuffer import RingBuffer
+
+# Band graph bands: delta, theta, alpha and beta in Hz, relative to the power over TOTAL_RANGE
+FREQUENCY_BANDS = [(0, 4), (4, 8), (8, 13), (13, 30)]
+TOTAL_RANGE = (0, 30)
+
+
+# Inclusive (low, high) bin ranges of frequency bands in Hz for a window of window_samples
+# Bin k is at k * sampling_rate / window_samples Hz, so the same bands give the same
+# frequencies for any window length or board; ranges end at the Nyquist bin
+def frequency_bins(bands, sampling_rate, window_samples):
+    resolution = sampling_rate / window_samples
+    nyquist_bin = window_samples // 2
+    bin_bands = []
+    for low, high in bands:
+        low_bin = min(int(np.ceil(low / resolution - 1e-9)), nyquist_bin)
+        high_bin = min(int(np.floor(high / resolution + 1e-9)), nyquist_bin)
+        bin_bands.append((low_bin, max(low_bin, high_bin)))
+    return bin_bands
+
+
+# Relative band powers of a sliding window, updated every hop without redoing the overlap
+# Only the DFT bins the bands need are kept. Each hop they are advanced with a sliding
+# DFT, one (channels x hop) @ (hop x bins) product for the samples that left and entered
+# the window, and once per window they are recomputed with an rfft so rounding can't build up.
+# bands are inclusive (low, high) bin ranges (see frequency_bins), each integrated with the
+# trapezoid rule and divided by the integral over total_band, then averaged over the channels.
+# The last history_length estimates are kept in a NumPy ring for smoothing
+class SlidingBandPower:
+    def __init__(self, num_channels, window_samples, hop_samples, bands, total_band,
+                 history_length=5):
+        self.num_channels = num_channels
+        self.window_samples = int(window_samples)
+        self.hop_samples = max(1, int(hop_samples))
+
+        # Only bins 0..num_bins-1 are needed
+        self.num_bins = max(high for low, high in list(bands) + [total_band]) + 1
+        self.bin_numbers = np.arange(self.num_bins)
+        self.weights = self._trapezoid_weights(bands, total_band)
+
+        # Sliding DFT factors for one hop
+        m = np.arange(self.hop_samples)[:, None]
+        self.hop_basis = np.exp(-2j * np.pi * m * self.bin_numbers / self.window_samples)
+        self.hop_rotation = np.exp(2j * np.pi * self.hop_samples * self.bin_numbers / self.window_samples)
+        self.hops_per_refresh = max(1, self.window_samples // self.hop_samples)
+
+        self.samples = RingBuffer(num_channels, 2 * self.window_samples)
+        self.spectrum = None
+        self.pending = 0
+        self.hops_since_refresh = 0
+        self.history = np.zeros((history_length, len(bands)))
+        self.history_count = 0
+        self.history_pos = 0
+
+    # (bins x bands+1) matrix, trapezoid weights of every band and of the total in the last column
+    def _trapezoid_weights(self, bands, total_band):
+        weights = np.zeros((self.num_bins, len(bands) + 1))
+        for column, (low, high) in enumerate(list(bands) + [total_band]):
+            weights[low:high + 1, column] = 1.0
+            weights[low, column] = 0.5
+            weights[high, column] = 0.5 if high > low else 0.0
+        return weights
+
+    # Add a (channels x samples) block, returns the number of new estimates
+    def write(self, block):
+        num_new = block.shape[1]
+        if num_new == 0:
+            return 0
+        self.samples.write(block)
+        self.pending += num_new
+        if self.samples.count < self.window_samples:
+            return 0
+        if self.spectrum is None or self.pending > self.samples.capacity - self.window_samples:
+            # First full window, or too far behind to slide, start from the newest window
+            self._refresh()
+            self.pending = 0
+            self._push(self._band_powers())
+            return 1
+
+        num_hops = self.pending // self.hop_samples
+        if num_hops == 0:
+            return 0
+        # Current window followed by the samples that arrived since
+        data = self.samples.latest(self.window_samples + self.pending)
+        for hop in range(num_hops):
+            start = hop * self.hop_samples
+            self.hops_since_refresh += 1
+            if self.hops_since_refresh >= self.hops_per_refresh:
+                end = start + self.hop_samples + self.window_samples
+                self._refresh(data[:, end - self.window_samples:end])
+            else:
+                leaving = data[:, start:start + self.hop_samples]
+                entering = data[:, start + self.window_samples:start + self.window_samples + self.hop_samples]
+                self.spectrum += (entering - leaving) @ self.hop_basis
+                self.spectrum *= self.hop_rotation
+            self._push(self._band_powers())
+        self.pending -= num_hops * self.hop_samples
+        return num_hops
+
+    # Recompute the kept bins of the window (default: the newest window) from scratch
+    def _refresh(self, window_data=None):
+        if window_data is None:
+            window_data = self.samples.latest(self.window_samples)
+        spectrum = np.fft.rfft(window_data, axis=1)
+        self.spectrum = np.ascontiguousarray(spectrum[:, :self.num_bins])
+        self.hops_since_refresh = 0
+
+    # Relative band powers averaged over channels from the current spectrum
+    def _band_powers(self):
+        magnitudes = np.abs(self.spectrum)
+        integrals = magnitudes @ self.weights
+        total = integrals[:, -1:]
+        relative = np.divide(integrals[:, :-1], total, out=np.zeros_like(integrals[:, :-1]), where=total != 0)
+        return np.mean(relative, axis=0)
+
+    def _push(self, values):
+        self.history[self.history_pos] = values
+        self.history_pos = (self.history_pos + 1) % len(self.history)
+        self.history_count = min(self.history_count + 1, len(self.history))
+
+    # Newest estimate
+    def latest(self):
+        return self.history[self.history_pos - 1]
+
+    # Mean of the kept estimates
+    def smoothed(self):
+        if self.history_count == 0:
+            return np.zeros(self.history.shape[1])
+        return np.mean(self.history[:self.history_count], axis=0)
@@ -0,0 +1,40 @@
+import numpy as np
+from scipy import signal
+from multitaper import multitaper_psd
+
+PSD_METHODS = ["Welch's", "Multitaper", "FFT"]
+
+
+# Power spectral density of an (..., samples) array in one vectorized call
+# Returns (frequencies, psd) with psd shaped (..., bins)
+def compute_psd(data, sampling_rate, method, welch_window_length_fraction=0.1):
+    num_samples = data.shape[-1]
+    if method == "Welch's":
+        welch_window_length = int(welch_window_length_fraction * num_samples)
+        frequencies, psd = signal.welch(data, fs=sampling_rate, nperseg=welch_window_length, axis=-1)
+    elif method == "Multitaper":
+        psd, frequencies = multitaper_psd(data, sampling_rate, adaptive=True, normalization='full')
+    elif method == "FFT":
+        fft = np.fft.rfft(data, axis=-1)
+        psd = fft.real ** 2 + fft.imag ** 2
+        frequencies = np.fft.rfftfreq(num_samples, 1 / sampling_rate)
+    else:
+        raise ValueError('Bandpower method is not implemented: ' + str(method))
+    return frequencies, psd
+
+
+# PSDs for several (channels x samples) recordings, e.g. state A and state B
+# Recordings of the same length are stacked into one (states x channels x samples)
+# array so each method runs once for all of them
+# Returns a list of (frequencies, psd[channels x bins]) in the order given
+def compute_psds(states, sampling_rate, method, welch_window_length_fraction=0.1):
+    results = [None] * len(states)
+    same_length = {}
+    for i, state in enumerate(states):
+        same_length.setdefault(state.shape[-1], []).append(i)
+    for indices in same_length.values():
+        stacked = np.stack([states[i] for i in indices])
+        frequencies, psd = compute_psd(stacked, sampling_rate, method, welch_window_length_fraction)
+        for k, i in enumerate(indices):
+            results[i] = (frequencies, psd[k])
+    return results
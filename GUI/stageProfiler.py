@@ -0,0 +1,165 @@
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QLabel
+
+# Number of timings kept per stage for the rolling statistics
+HISTORY_LENGTH = 500
+# Number of events kept for the Chrome trace export
+TRACE_LENGTH = 200000
+
+
+# Lightweight timing of the hot path of every page
+# Pages wrap each step of their update in `with profiler.stage(name):` and call
+# tick() at the start of every timer tick. Keeps rolling timings per stage, the
+# achieved update rate and dropped ticks per page, counters pages publish with
+# set_counter() (e.g. skipped ticks), and a trace for chrome://tracing
+class StageProfiler:
+    def __init__(self, history_length=HISTORY_LENGTH, trace_length=TRACE_LENGTH):
+        self.history_length = history_length
+        self.durations = {}
+        self.tick_times = {}
+        self.tick_intervals = {}
+        self.dropped_ticks = {}
+        self.counters = {}
+        self.trace_events = deque(maxlen=trace_length)
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    # Time the body of a with block as one stage
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name, start, end):
+        with self.lock:
+            durations = self.durations.get(name)
+            if durations is None:
+                durations = self.durations[name] = deque(maxlen=self.history_length)
+            durations.append((end - start) * 1000.0)
+            self.trace_events.append((name, start, end, threading.get_ident()))
+
+    # Call at the start of a page's timer callback
+    # A gap of more than 1.5 intervals counts the missing ticks as dropped
+    def tick(self, page, interval_ms):
+        now = time.perf_counter()
+        with self.lock:
+            times = self.tick_times.get(page)
+            if times is None:
+                times = self.tick_times[page] = deque(maxlen=self.history_length)
+                self.dropped_ticks[page] = 0
+            if len(times) > 0 and interval_ms > 0:
+                gap_ms = (now - times[-1]) * 1000.0
+                if gap_ms > 1.5 * interval_ms:
+                    self.dropped_ticks[page] += int(round(gap_ms / interval_ms)) - 1
+            times.append(now)
+            self.tick_intervals[page] = interval_ms
+
+    # Latest value of a running count kept by a page, shown with the page rates
+    def set_counter(self, name, value):
+        with self.lock:
+            self.counters[name] = value
+
+    def counter_summary(self):
+        with self.lock:
+            return dict(self.counters)
+
+    # Rolling mean/p50/p95/max in ms for every stage
+    def stage_summary(self):
+        with self.lock:
+            durations = {name: np.array(values) for name, values in self.durations.items()}
+        summary = {}
+        for name, values in durations.items():
+            if len(values) == 0:
+                continue
+            summary[name] = {
+                'mean': float(np.mean(values)),
+                'p50': float(np.percentile(values, 50)),
+                'p95': float(np.percentile(values, 95)),
+                'max': float(np.max(values)),
+            }
+        return summary
+
+    # Achieved ticks per second, requested ticks per second and dropped ticks for every page
+    def rate_summary(self):
+        summary = {}
+        with self.lock:
+            for page, times in self.tick_times.items():
+                achieved = 0.0
+                if len(times) > 1 and times[-1] > times[0]:
+                    achieved = (len(times) - 1) / (times[-1] - times[0])
+                interval_ms = self.tick_intervals[page]
+                requested = 1000.0 / interval_ms if interval_ms > 0 else 0.0
+                summary[page] = {'achieved_hz': achieved, 'requested_hz': requested,
+                                 'dropped': self.dropped_ticks[page]}
+        return summary
+
+    # Write the recorded stages in Chrome trace event format (chrome://tracing, Perfetto)
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events = list(self.trace_events)
+        trace_events = [{
+            'name': name,
+            'cat': name.split('.')[0],
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': 1,
+            'tid': thread_id,
+        } for name, start, end, thread_id in events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, f)
+
+    def reset(self):
+        with self.lock:
+            self.durations.clear()
+            self.tick_times.clear()
+            self.tick_intervals.clear()
+            self.dropped_ticks.clear()
+            self.counters.clear()
+            self.trace_events.clear()
+
+
+# On-screen text overlay of the profiler, refreshed twice a second while visible
+class ProfilerOverlay(QLabel):
+    def __init__(self, profiler, refresh_ms=500):
+        super().__init__()
+        self.profiler = profiler
+        self.setStyleSheet("""
+            color: #0f0;
+            font-family: monospace;
+            font-size: 11px;
+        """)
+        self.refresh_timer = QTimer()
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_ms = refresh_ms
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.refresh_timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.refresh_timer.start(self.refresh_ms)
+
+    def refresh(self):
+        lines = []
+        for page, rate in sorted(self.profiler.rate_summary().items()):
+            lines.append('{:<28} {:6.1f} / {:6.1f} Hz  dropped {}'.format(
+                page, rate['achieved_hz'], rate['requested_hz'], rate['dropped']))
+        for name, value in sorted(self.profiler.counter_summary().items()):
+            lines.append('{:<28} {}'.format(name, value))
+        for name, timing in sorted(self.profiler.stage_summary().items()):
+            lines.append('{:<28} {:8.2f} ms  p95 {:8.2f} ms  max {:8.2f} ms'.format(
+                name, timing['mean'], timing['p95'], timing['max']))
+        self.setText('\n'.join(lines) if lines else 'No stages recorded yet')
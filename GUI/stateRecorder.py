@@ -0,0 +1,60 @@
+import time
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+
+# Timed capture from the shared acquisition stream without blocking the GUI thread
+# Every new block is copied into a preallocated buffer as it arrives, so the length
+# of a recording isn't limited by BrainFlow's buffer or the shared ring buffer
+class StateRecorder(QObject):
+    progress = Signal(int)
+    finished = Signal(object)
+    cancelled = Signal()
+
+    def __init__(self, acquisition, rows):
+        super().__init__()
+        self.acquisition = acquisition
+        self.rows = rows
+        self.data = None
+        self.num_recorded = 0
+        self.cursor = 0
+        self.start_time = None
+        self.recording = False
+
+    # Start capturing the given number of seconds of the selected rows
+    def start(self, seconds):
+        num_samples = int(seconds * self.acquisition.sampling_rate)
+        self.data = np.zeros((len(self.rows), num_samples))
+        self.num_recorded = 0
+        self.cursor = self.acquisition.cursor(0, self)
+        self.start_time = time.time()
+        self.recording = True
+        self.acquisition.samplesReady.connect(self.collect)
+        if num_samples == 0:
+            self._finish()
+
+    def cancel(self):
+        if self.recording:
+            self._stop()
+            self.cancelled.emit()
+
+    # Copy the samples that arrived since the last call into the recording
+    def collect(self, num_new_samples=0):
+        if not self.recording:
+            return
+        new_data, self.cursor = self.acquisition.get_data_since(self.cursor, self)
+        num_samples = min(new_data.shape[1], self.data.shape[1] - self.num_recorded)
+        self.data[:, self.num_recorded:self.num_recorded + num_samples] = new_data[self.rows, :num_samples]
+        self.num_recorded += num_samples
+        self.progress.emit(int(100 * self.num_recorded / self.data.shape[1]))
+        if self.num_recorded == self.data.shape[1]:
+            self._finish()
+
+    def _finish(self):
+        self._stop()
+        self.finished.emit(self.data)
+
+    def _stop(self):
+        self.recording = False
+        self.acquisition.samplesReady.disconnect(self.collect)
+        self.acquisition.release(self)